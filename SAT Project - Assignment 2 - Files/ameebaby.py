@@ -7,7 +7,17 @@ THIS is the file to edit.
 Implement: solve_cnf(clauses) -> (status, model_or_None)
 """
 
-from typing import Iterable, List, Tuple
+import os
+import random
+import sys
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+# The branching heuristics live with the rest of the SAT solver in src/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from heuristics import VARIABLE_ORDERS
+from restarts import RESTART_POLICIES
+from preprocess import Preprocessor
 
 # ------------------------------
 # Basic helpers for literals
@@ -22,16 +32,76 @@ def neg(lit: int) -> int:
     return -lit
 
 
+# ------------------------------
+# Clause arena
+# ------------------------------
+#
+# All clauses live one after another in a single list, the arena. A clause
+# is referred to by the offset of its header (its cref), and its literals
+# follow the header:
+#
+#   arena[cref + SIZE]      number of literals
+#   arena[cref + FLAGS]     LEARNT and DELETED bits
+#   arena[cref + LBD]       number of distinct decision levels among the
+#                           literals when the clause was learned (glue),
+#                           0 for original clauses
+#   arena[cref + ACTIVITY]  index of the clause activity in the activity
+#                           array of the solver, -1 for original clauses
+#   arena[cref + HEADER:cref + HEADER + size]  the literals
+#
+# The arena is a list rather than an array('i'), as reading an array makes a
+# new int object every time, which propagation cannot afford. Its entries
+# cost a pointer each instead: every literal is stored as the one int object
+# of that literal in the solver's literals table, so no clause holds ints of
+# its own.
+
+SIZE = 0
+FLAGS = 1
+LBD = 2
+ACTIVITY = 3
+HEADER = 4
+
+LEARNT = 1
+DELETED = 2
+
+# Reason of decisions, and of assignments at level 0 that need none
+NO_REASON = -1
+
+
 # ------------------------------
 # CDCL Solver
 # ------------------------------
 
 class CDCLSolver:
-    def __init__(self, clauses: List[List[int]], num_vars: int):
+    def __init__(self, clauses: List[List[int]], num_vars: int, order: str = "vsids",
+                 first_reduce: int = 2000, reduce_inc: int = 300, core_lbd: int = 2,
+                 clause_decay: float = 0.999, restart: str = "glucose",
+                 restart_options: Dict[str, float] | None = None, garbage_frac: float = 0.2,
+                 seed: int | None = None):
         self.num_vars = num_vars
 
-        # Clause database: original clauses + learned clauses
-        self.clauses: List[List[int]] = [list(c) for c in clauses]
+        # Clause database, see the clause arena above:
+        #  - clauses and learnts hold the crefs of the original and learned clauses
+        #  - activity[arena[cref + ACTIVITY]] is the activity of a learned clause
+        #  - wasted counts the arena entries of deleted clauses, the arena is
+        #    compacted when they are more than garbage_frac of it
+        self.arena: List[int] = []
+        self.clauses: List[int] = []
+        self.activity = array('d')
+        self.wasted: int = 0
+        self.garbage_frac: float = garbage_frac
+
+        # Learned clauses, reduced periodically:
+        #  - the first reduction happens after first_reduce conflicts, and the
+        #    interval grows by reduce_inc after each one
+        #  - clauses with lbd <= core_lbd are never removed
+        self.learnts: List[int] = []
+        self.next_reduce: int = first_reduce
+        self.reduce_interval: int = first_reduce
+        self.reduce_inc: int = reduce_inc
+        self.core_lbd: int = core_lbd
+        self.cla_inc: float = 1.0
+        self.clause_decay: float = clause_decay
 
         # Assignments: None = UNDEF, True/False = value
         # Use 1-based indexing for variables (index 0 unused)
@@ -40,8 +110,8 @@ class CDCLSolver:
         # Decision level per variable (0..current_level)
         self.level: List[int] = [0] * (num_vars + 1)
 
-        # Reason clause per variable (None if decision)
-        self.reason: List[List[int] | None] = [None] * (num_vars + 1)
+        # Reason clause per variable (its cref, NO_REASON if decision)
+        self.reason: List[int] = [NO_REASON] * (num_vars + 1)
 
         # Trail of assigned literals in order
         self.trail: List[int] = []
@@ -49,10 +119,114 @@ class CDCLSolver:
         # trail_lim[i] = index in trail where decision level i starts
         self.trail_lim: List[int] = []
 
+        # Branching order over variables 1..num_vars ("vsids" or "static")
+        # Saved phase per variable: the value it had when it was last unassigned,
+        # used as the polarity of the next decision on it (True at first).
+        # With a seed, the order breaks ties between variables by random keys
+        # (see heuristics.py) and the phases start random, so that solvers
+        # with different seeds search differently.
+        self.phase: List[bool] = [True] * (num_vars + 1)
+        if seed is not None:
+            rng = random.Random(seed)
+            self.phase = [rng.random() < 0.5 for _ in range(num_vars + 1)]
+        self.order = VARIABLE_ORDERS[order](num_vars + 1, range(1, num_vars + 1), seed)
+
+        # Restart policy ("none", "luby", "geometric" or "glucose"), with its
+        # parameters given as keyword arguments in restart_options
+        self.restart_policy = RESTART_POLICIES[restart](**(restart_options or {}))
+
+        # Scratch space of conflict analysis, reused on every conflict:
+        #  - seen[v] == stamp marks v as part of the current analysis, either in
+        #    the learned clause, resolved away, or shown redundant. A new
+        #    conflict takes a new stamp, so nothing has to be cleared.
+        #  - analyze_stack and analyze_toclear are the work list and the undo
+        #    list of the redundancy check in lit_redundant
+        #  - analyze_implied collects the variables of the assumption level
+        #    the learned clause depends on (see analyze)
+        #  - level_seen[l] == lbd_stamp marks decision level l as counted by
+        #    the LBD computation under way (see compute_lbd)
+        self.seen: List[int] = [0] * (num_vars + 1)
+        self.stamp: int = 0
+        self.level_seen: List[int] = [0] * (num_vars + 2)
+        self.lbd_stamp: int = 0
+        self.analyze_stack: List[int] = []
+        self.analyze_toclear: List[int] = []
+        self.analyze_implied: List[int] = []
+
+        # Assumptions of the current call to solve (see search):
+        #  - assumption_level is 1 while there are assumptions, else 0
+        #  - implied_by[v], for v on the assumption level, holds the negations
+        #    of the assumptions v follows from. It is filled in along the
+        #    trail up to implied_head, and only goes stale when the trail is
+        #    undone below it, which takes a backjump to level 0.
+        self.assumption_level: int = 0
+        self.implied_by: List[Tuple[int, ...]] = [()] * (num_vars + 1)
+        self.implied_head: int = 0
+
+        # Result of the last call to solve:
+        #  - model: DIMACS model if it was satisfiable
+        #  - failed: if it was unsatisfiable, the assumptions that could not
+        #    hold together (empty when the formula itself is unsatisfiable)
+        self.model: List[int] | None = None
+        self.failed: List[int] = []
+
+        # Propagation head: trail[qhead:] still has to be propagated
+        self.qhead: int = 0
+
+        # Watch lists: literal -> clauses currently watching that literal, as
+        # flat pairs (cref, blocker). The blocker is another literal of the
+        # clause: while it is true the clause is satisfied and is not visited.
+        # The two watched literals of a clause are always its first two.
+        self.watches: Dict[int, List[int]] = {}
+        for v in range(1, num_vars + 1):
+            self.watches[v] = []
+            self.watches[-v] = []
+
+        # The int object of every literal, stored in the arena in place of
+        # the caller's: literals[lit] for lit in -num_vars..num_vars, the
+        # negative ones indexing from the end
+        self.literals: List[int] = list(range(num_vars + 1)) + list(range(-num_vars, 0))
+
+        # False once a top-level contradiction has been found while loading
+        self.ok: bool = True
+
+        # Search statistics
+        self.decisions: int = 0
+        self.conflicts: int = 0
+        self.propagations: int = 0
+        self.reductions: int = 0
+        self.deleted_clauses: int = 0
+        self.minimized_literals: int = 0
+        self.compactions: int = 0
+        self.imported: int = 0
+
+        # Exchange of learned clauses with solvers running in parallel (see
+        # portfolio.py), None when solving alone. It gets every learned
+        # clause with export(lits, lbd), gives the (lits, lbd) of the others
+        # with imports() at restarts, and stopped() tells when to give up.
+        self.exchange = None
+
+        for clause in clauses:
+            self.add_clause(clause)
+
     # ------------------------------
     # Utility methods
     # ------------------------------
 
+    def stats(self) -> Dict[str, int]:
+        return {
+            "decisions": self.decisions,
+            "conflicts": self.conflicts,
+            "propagations": self.propagations,
+            "learnts": len(self.learnts),
+            "reductions": self.reductions,
+            "deleted_clauses": self.deleted_clauses,
+            "restarts": self.restart_policy.restarts,
+            "minimized_literals": self.minimized_literals,
+            "compactions": self.compactions,
+            "imported": self.imported,
+        }
+
     def current_level(self) -> int:
         return len(self.trail_lim)
 
@@ -73,10 +247,83 @@ class CDCLSolver:
         else:
             return False
 
+    def add_clause(self, clause: List[int]) -> None:
+        """
+        Add an original clause at decision level 0:
+          - duplicate literals are removed, tautologies are dropped
+          - unit clauses are enqueued directly
+          - longer clauses are attached to the watch lists
+        """
+        lits: List[int] = []
+        for lit in clause:
+            if neg(lit) in lits:
+                return  # tautology, always satisfied
+            if lit not in lits:
+                lits.append(lit)
+
+        if len(lits) == 0:
+            self.ok = False
+        elif len(lits) == 1:
+            if not self.enqueue(lits[0], NO_REASON):
+                self.ok = False
+        else:
+            cref = self.alloc(lits)
+            self.clauses.append(cref)
+            self.attach_clause(cref)
+
+    def add_shared(self, lits: Iterable[int], lbd: int) -> None:
+        """
+        Add a clause learned by another solver, with the LBD it had there,
+        at decision level 0:
+          - satisfied clauses are dropped, false literals removed
+          - units are enqueued, and propagated by the next propagate()
+          - longer clauses are added as learned clauses
+        """
+        kept: List[int] = []
+        for lit in lits:
+            val = self.value_lit(lit)
+            if val is True:
+                return
+            if val is None:
+                kept.append(lit)
+
+        self.imported += 1
+        if len(kept) == 0:
+            self.ok = False
+        elif len(kept) == 1:
+            self.enqueue(kept[0], NO_REASON)
+        else:
+            cref = self.alloc(kept, min(lbd, len(kept)), learnt=True)
+            self.learnts.append(cref)
+            self.attach_clause(cref)
+
+    def alloc(self, lits: List[int], lbd: int = 0, learnt: bool = False) -> int:
+        """Store a clause at the end of the arena, and return its cref."""
+        arena = self.arena
+        cref = len(arena)
+        activity = -1
+        if learnt:
+            activity = len(self.activity)
+            self.activity.append(0.0)
+        arena.extend((len(lits), LEARNT if learnt else 0, lbd, activity))
+        arena.extend(map(self.literals.__getitem__, lits))
+        return cref
+
+    def clause_lits(self, cref: int) -> List[int]:
+        start = cref + HEADER
+        return self.arena[start:start + self.arena[cref + SIZE]]
+
+    def attach_clause(self, cref: int) -> None:
+        """Watch the first two literals of a clause, each with the other as blocker."""
+        first = self.arena[cref + HEADER]
+        second = self.arena[cref + HEADER + 1]
+        self.watches[first].extend((cref, second))
+        self.watches[second].extend((cref, first))
+
     def new_decision_level(self) -> None:
         self.trail_lim.append(len(self.trail))
 
-    def enqueue(self, lit: int, reason: List[int] | None) -> bool:
+    def enqueue(self, lit: int, reason: int) -> bool:
         """
         Assign literal lit with given reason clause.
         Returns False if this contradicts an existing assignment.
@@ -98,47 +345,83 @@ class CDCLSolver:
     # Propagation
     # ------------------------------
 
-    def propagate(self) -> List[int] | None:
+    def propagate(self) -> int | None:
         """
-        Naive unit propagation:
-          - returns conflict clause if a conflict is found
+        Two-watched-literal unit propagation:
+          - processes trail[qhead:], visiting only the clauses watching
+            the literals that just became false, unless their blocker is true
+          - returns the cref of the conflict clause if a conflict is found
           - returns None otherwise
         """
-        # We propagate until no new assignments are made
-        while True:
-            any_new = False
-
-            for clause in self.clauses:
-                # Check clause status: satisfied / unit / conflict / unresolved
-                num_unassigned = 0
-                last_unassigned = None
-                clause_sat = False
-
-                for lit in clause:
-                    val = self.value_lit(lit)
-                    if val is True:
-                        clause_sat = True
-                        break
-                    elif val is None:
-                        num_unassigned += 1
-                        last_unassigned = lit
+        assigns = self.assigns
+        watches = self.watches
+        trail = self.trail
+        arena = self.arena
+
+        while self.qhead < len(trail):
+            false_lit = neg(trail[self.qhead])
+            self.qhead += 1
+            self.propagations += 1
+
+            ws = watches[false_lit]
+            n = len(ws)
+            i = j = 0
+            while i < n:
+                cref = ws[i]
+                blocker = ws[i + 1]
+                i += 2
 
-                if clause_sat:
+                # Clause satisfied by its blocker -> keep watching, without
+                # looking at the clause itself
+                val = assigns[abs(blocker)]
+                if val is not None and val == (blocker > 0):
+                    ws[j] = cref
+                    ws[j + 1] = blocker
+                    j += 2
                     continue
 
-                if num_unassigned == 0:
-                    # All literals are False -> conflict
-                    return clause
+                # Make sure the false literal is the second one
+                start = cref + HEADER
+                if arena[start] == false_lit:
+                    arena[start] = arena[start + 1]
+                    arena[start + 1] = false_lit
 
-                if num_unassigned == 1 and last_unassigned is not None:
-                    # Unit clause -> force the last unassigned literal
-                    if not self.enqueue(last_unassigned, clause):
-                        # Contradiction when enqueuing
-                        return clause
-                    any_new = True
+                # Clause already satisfied by the other watch -> keep watching,
+                # with that watch as the new blocker
+                first = arena[start]
+                if first != blocker:
+                    val = assigns[abs(first)]
+                    if val is not None and val == (first > 0):
+                        ws[j] = cref
+                        ws[j + 1] = first
+                        j += 2
+                        continue
 
-            if not any_new:
-                break
+                # Look for a new literal to watch that is not False
+                for k in range(start + 2, start + arena[cref + SIZE]):
+                    lit = arena[k]
+                    val = assigns[abs(lit)]
+                    if val is None or val == (lit > 0):
+                        arena[start + 1] = lit
+                        arena[k] = false_lit
+                        watches[lit].extend((cref, first))
+                        break
+                else:
+                    # No new watch: clause is unit under its first literal, or conflicting
+                    ws[j] = cref
+                    ws[j + 1] = first
+                    j += 2
+                    if not self.enqueue(first, cref):
+                        # Conflict: keep the remaining watchers and stop
+                        while i < n:
+                            ws[j] = ws[i]
+                            j += 1
+                            i += 1
+                        del ws[j:]
+                        self.qhead = len(trail)
+                        return cref
+
+            del ws[j:]
 
         return None
 
@@ -146,28 +429,64 @@ class CDCLSolver:
     # Conflict Analysis (1-UIP)
     # ------------------------------
 
-    def analyze(self, confl_clause: List[int]) -> Tuple[List[int], int]:
+    def analyze(self, confl: int) -> Tuple[List[int], int]:
         """
         Perform 1-UIP conflict analysis.
         Returns (learned_clause, backtrack_level).
+
+        The asserting literal is learned_clause[0] and, for non-unit clauses,
+        learned_clause[1] is a literal of the backtrack level, so the clause
+        can be watched on those two right after backjumping.
+
+        Literals of the assumption level are treated like those of level 0,
+        in the analysis and the minimization alike, except that the
+        negations of the assumptions they follow from (see implied_by) are
+        added at the end of the clause. They are all false until the next
+        call, so they are the last literals looked at for a new watch.
+
+        The clause is minimized before it is returned: a literal is dropped
+        when its reason clause is made of literals of the learned clause, or
+        of literals that are redundant in turn (see lit_redundant).
         """
-        seen: set[int] = set()
-        learnt: List[int] = []
+        self.stamp += 1
+        stamp = self.stamp
+        seen = self.seen
+        level = self.level
+        arena = self.arena
+        current = self.current_level()
+        assumption_level = self.assumption_level
+        implied = self.analyze_implied
+        implied.clear()
+        # Slot 0 is kept for the asserting literal, known at the end only
+        learnt: List[int] = [0]
         pathC = 0
         p = None  # last involved literal
 
         # Start from conflict clause
-        c = confl_clause
+        c = confl
         idx = len(self.trail) - 1  # start from end of trail
 
         while True:
+            if arena[c + FLAGS] & LEARNT:
+                # Learned clause taking part in the conflict: bump it, and
+                # tighten its LBD if it is lower under the current levels
+                self.bump_clause(c)
+                if arena[c + LBD] > self.core_lbd:
+                    lbd = self.compute_lbd(arena, c + HEADER, c + HEADER + arena[c + SIZE])
+                    if lbd < arena[c + LBD]:
+                        arena[c + LBD] = lbd
+
             # walk the clause
-            for lit in c:
-                v = var_of(lit)
-                if v not in seen and self.level[v] > 0:
-                    seen.add(v)
-                    if self.level[v] == self.current_level():
+            for k in range(c + HEADER, c + HEADER + arena[c + SIZE]):
+                lit = arena[k]
+                v = abs(lit)
+                if seen[v] != stamp and level[v] > 0:
+                    seen[v] = stamp
+                    self.order.bump(v)
+                    if level[v] == current:
                         pathC += 1
+                    elif level[v] == assumption_level:
+                        implied.append(v)
                     else:
                         learnt.append(lit)
 
@@ -176,17 +495,17 @@ class CDCLSolver:
                 p = self.trail[idx]
                 v = var_of(p)
                 idx -= 1
-                if v in seen:
+                if seen[v] == stamp:
                     break
 
-            seen.remove(v)
+            # v stays in 'seen' so its own literal in the reason clause is skipped
             pathC -= 1
             reason_clause = self.reason[v]
 
             if pathC == 0:
                 break
 
-            if reason_clause is None:
+            if reason_clause == NO_REASON:
                 # no reason for this literal (decision) -> stop
                 break
 
@@ -195,30 +514,170 @@ class CDCLSolver:
 
         # asserting literal is negation of p
         assert p is not None
-        learnt.append(neg(p))
+        learnt[0] = neg(p)
+
+        # Minimize: literals whose level is not among the levels of the clause
+        # cannot be redundant, the abstract levels rule most of them out cheaply
+        if len(learnt) > 2:
+            abstract_levels = 0
+            for i in range(1, len(learnt)):
+                abstract_levels |= 1 << (level[var_of(learnt[i])] & 31)
+            reason = self.reason
+            j = 1
+            for i in range(1, len(learnt)):
+                lit = learnt[i]
+                if reason[var_of(lit)] == NO_REASON or not self.lit_redundant(lit, abstract_levels):
+                    learnt[j] = lit
+                    j += 1
+            self.minimized_literals += len(learnt) - j
+            del learnt[j:]
+
+        if implied:
+            self.extend_implied()
+            implied_by = self.implied_by
+            assumptions = set()
+            for v in implied:
+                assumptions.update(implied_by[v])
+            learnt.extend(assumptions)
 
         # compute backtrack level: max level among literals in learnt except the asserting one
         if len(learnt) == 1:
             backtrack_level = 0
         else:
-            max_level = 0
-            for lit in learnt[:-1]:
-                v = var_of(lit)
-                lv = self.level[v]
-                if lv > max_level:
-                    max_level = lv
-            backtrack_level = max_level
+            max_i = 1
+            for i in range(2, len(learnt)):
+                if self.level[var_of(learnt[i])] > self.level[var_of(learnt[max_i])]:
+                    max_i = i
+            # Move the highest-level literal to the second watch position
+            learnt[1], learnt[max_i] = learnt[max_i], learnt[1]
+            backtrack_level = self.level[var_of(learnt[1])]
 
         return learnt, backtrack_level
 
+    def lit_redundant(self, lit: int, abstract_levels: int) -> bool:
+        """
+        Returns True if lit can be dropped from the clause being learned,
+        because following reasons back from it only reaches literals of the
+        clause (or of level 0). Literals of the assumption level are not
+        followed further, they go to analyze_implied instead (see analyze).
+
+        Variables shown redundant are stamped as seen, so later checks stop at
+        them. If the check fails, the stamps it added are taken back.
+        """
+        seen = self.seen
+        stamp = self.stamp
+        level = self.level
+        reason = self.reason
+        arena = self.arena
+        assumption_level = self.assumption_level
+        implied = self.analyze_implied
+        implied_count = len(implied)
+        stack = self.analyze_stack
+        toclear = self.analyze_toclear
+        stack.clear()
+        toclear.clear()
+        stack.append(lit)
+        while stack:
+            c = reason[abs(stack.pop())]
+            for k in range(c + HEADER, c + HEADER + arena[c + SIZE]):
+                q = arena[k]
+                v = abs(q)
+                if seen[v] == stamp or level[v] == 0:
+                    continue
+                if level[v] == assumption_level:
+                    seen[v] = stamp
+                    toclear.append(v)
+                    implied.append(v)
+                elif reason[v] != NO_REASON and (1 << (level[v] & 31)) & abstract_levels:
+                    seen[v] = stamp
+                    stack.append(q)
+                    toclear.append(v)
+                else:
+                    for u in toclear:
+                        seen[u] = 0
+                    del implied[implied_count:]
+                    return False
+        return True
+
     # ------------------------------
     # Backtracking
     # ------------------------------
 
+    def analyze_final(self, lits: Iterable[int]) -> List[int]:
+        """
+        The literals lits are false at the assumption level: return the
+        assumptions they were implied false by, going back over the reasons
+        on the trail. Every decision of the assumption level is an assumption.
+        """
+        failed: List[int] = []
+        if self.current_level() == 0:
+            return failed
+        # Only the assumption level can be involved
+        end = self.trail_lim[1] if self.current_level() > 1 else len(self.trail)
+
+        self.stamp += 1
+        stamp = self.stamp
+        seen = self.seen
+        level = self.level
+        arena = self.arena
+        for lit in lits:
+            seen[var_of(lit)] = stamp
+        for i in range(end - 1, self.trail_lim[0] - 1, -1):
+            lit = self.trail[i]
+            v = var_of(lit)
+            if seen[v] != stamp:
+                continue
+            c = self.reason[v]
+            if c == NO_REASON:
+                failed.append(lit)
+            else:
+                for k in range(c + HEADER, c + HEADER + arena[c + SIZE]):
+                    q = var_of(arena[k])
+                    if level[q] > 0:
+                        seen[q] = stamp
+        return failed
+
+    def extend_implied(self) -> None:
+        """
+        Fill in implied_by for the literals of the assumption level that came
+        after implied_head, in trail order, so the reasons of a literal are
+        done before it. Called above the assumption level only, once it is
+        fully propagated. It grows again only by the asserting literals of
+        clauses learned back to it, so nearly all of it is done once per call.
+        """
+        trail = self.trail
+        level = self.level
+        reason = self.reason
+        arena = self.arena
+        implied_by = self.implied_by
+        for i in range(max(self.implied_head, self.trail_lim[0]), self.trail_lim[1]):
+            lit = trail[i]
+            v = var_of(lit)
+            c = reason[v]
+            if c == NO_REASON:
+                implied_by[v] = (neg(lit),)
+                continue
+            # Share the tuple of the first literal when no other adds to it
+            first = None
+            merged = None
+            for k in range(c + HEADER, c + HEADER + arena[c + SIZE]):
+                u = var_of(arena[k])
+                if u == v or level[u] == 0:
+                    continue
+                if first is None:
+                    first = implied_by[u]
+                elif implied_by[u] is not first:
+                    if merged is None:
+                        merged = set(first)
+                    merged.update(implied_by[u])
+            implied_by[v] = tuple(merged) if merged is not None else first or ()
+        self.implied_head = self.trail_lim[1]
+
     def cancel_until(self, level: int) -> None:
         """
         Backtrack to a given decision level:
         unassign all variables with level > level.
+        Watch lists stay valid as they are, so nothing else is undone.
         """
         if self.current_level() <= level:
             return
@@ -228,12 +687,131 @@ class CDCLSolver:
         # Unassign all variables from trail[cut:]
         for i in range(len(self.trail) - 1, cut - 1, -1):
             v = var_of(self.trail[i])
+            self.phase[v] = self.assigns[v]
             self.assigns[v] = None
-            self.reason[v] = None
+            self.reason[v] = NO_REASON
             self.level[v] = 0
+            self.order.insert(v)
+
+        del self.trail[cut:]
+        del self.trail_lim[level:]
+        self.qhead = cut
+        self.implied_head = min(self.implied_head, cut)
+
+    # ------------------------------
+    # Learned clause database
+    # ------------------------------
+
+    def compute_lbd(self, lits: List[int], start: int, end: int) -> int:
+        """
+        Number of distinct decision levels among the literals lits[start:end],
+        a learned clause or a clause of the arena. Every level is counted the
+        first time it is stamped, so nothing is built or cleared.
+        """
+        self.lbd_stamp += 1
+        stamp = self.lbd_stamp
+        level_seen = self.level_seen
+        level = self.level
+        lbd = 0
+        for k in range(start, end):
+            lv = level[abs(lits[k])]
+            if level_seen[lv] != stamp:
+                level_seen[lv] = stamp
+                lbd += 1
+        return lbd
+
+    def bump_clause(self, cref: int) -> None:
+        activity = self.activity
+        idx = self.arena[cref + ACTIVITY]
+        activity[idx] += self.cla_inc
+        if activity[idx] > 1e20:
+            # Rescale all activities to keep them in floating point range
+            for i in range(len(activity)):
+                activity[i] *= 1e-20
+            self.cla_inc *= 1e-20
+
+    def locked(self, cref: int) -> bool:
+        """A clause is locked while it is the reason of its first literal."""
+        v = var_of(self.arena[cref + HEADER])
+        return self.reason[v] == cref and self.assigns[v] is not None
+
+    def reduce_db(self) -> None:
+        """
+        Remove about half of the learned clauses:
+          - core clauses (lbd <= core_lbd) are always kept
+          - locked clauses (current reasons) are always kept
+          - of the others, the ones with the highest LBD go first, ties
+            broken by lowest activity
+        """
+        self.reductions += 1
+        arena = self.arena
+        activity = self.activity
+        candidates = [c for c in self.learnts if arena[c + LBD] > self.core_lbd]
+        candidates.sort(key=lambda c: (-arena[c + LBD], activity[arena[c + ACTIVITY]]))
+        self.remove_learnts(candidates[:len(candidates) // 2])
+
+    def remove_learnts(self, crefs: Iterable[int]) -> None:
+        """
+        Remove the given learned clauses, except the locked ones.
+        Removed clauses are marked as deleted and dropped from the watch lists.
+        Their space in the arena is reclaimed by compact() once enough of it
+        is wasted.
+        """
+        arena = self.arena
+        removed = 0
+        for c in crefs:
+            if not self.locked(c):
+                arena[c + FLAGS] |= DELETED
+                self.wasted += HEADER + arena[c + SIZE]
+                removed += 1
+        if not removed:
+            return
+
+        self.deleted_clauses += removed
+        self.learnts = [c for c in self.learnts if not arena[c + FLAGS] & DELETED]
+        for lit, ws in self.watches.items():
+            kept = []
+            for i in range(0, len(ws), 2):
+                if not arena[ws[i] + FLAGS] & DELETED:
+                    kept.append(ws[i])
+                    kept.append(ws[i + 1])
+            self.watches[lit] = kept
+
+        if self.wasted > len(arena) * self.garbage_frac:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Copy the clauses that are not deleted to a new arena, and move every
+        cref (clause lists, watch lists and reasons) to the new offsets
+        """
+        self.compactions += 1
+        arena = self.arena
+        new_arena: List[int] = []
+        new_activity = array('d')
+        moved: Dict[int, int] = {}
+        for crefs in (self.clauses, self.learnts):
+            for i, cref in enumerate(crefs):
+                new_cref = len(new_arena)
+                moved[cref] = new_cref
+                crefs[i] = new_cref
+                new_arena.extend(arena[cref:cref + HEADER + arena[cref + SIZE]])
+                if arena[cref + FLAGS] & LEARNT:
+                    new_arena[new_cref + ACTIVITY] = len(new_activity)
+                    new_activity.append(self.activity[arena[cref + ACTIVITY]])
+
+        for ws in self.watches.values():
+            for i in range(0, len(ws), 2):
+                ws[i] = moved[ws[i]]
+        reason = self.reason
+        for lit in self.trail:
+            v = var_of(lit)
+            if reason[v] != NO_REASON:
+                reason[v] = moved[reason[v]]
 
-        self.trail = self.trail[:cut]
-        self.trail_lim = self.trail_lim[:level]
+        self.arena = new_arena
+        self.activity = new_activity
+        self.wasted = 0
 
     # ------------------------------
     # Branching heuristic
@@ -241,43 +819,138 @@ class CDCLSolver:
 
     def pick_branch_lit(self) -> int | None:
         """
-        Very simple branching: pick the smallest-index unassigned var, with positive polarity.
+        Pick the next unassigned var of the branching order
+        (highest VSIDS activity by default). Its polarity is the saved phase.
         """
-        for v in range(1, self.num_vars + 1):
-            if self.assigns[v] is None:
-                return v  # literal "v" (positive)
-        return None
+        assigns = self.assigns
+        return self.order.pick(lambda v: assigns[v] is None)  # literal "v" (positive)
 
     # ------------------------------
     # Main CDCL solve loop
     # ------------------------------
 
-    def solve(self) -> bool:
+    def solve(self, assumptions: Iterable[int] = ()) -> bool | None:
         """
         Main CDCL search loop:
          - propagate
          - if conflict, analyze, learn, backjump
+         - else, decide the assumptions, if not done yet
          - else, if all assigned -> SAT
          - else, decide a new variable
+
+        assumptions are literals that must hold in this call only. They are
+        all decided first, together on decision level 1 (the assumption
+        level), so every learned clause still follows from the clauses alone,
+        and restarts go back to the assumption level only. The learned
+        clauses that contain the negation of an assumption are mostly of use
+        under these assumptions only, so they are removed at the end of the
+        call and the others are kept for the next one. The solver can be
+        called again with other assumptions afterwards, the result is left
+        in model or failed (see __init__).
+
+        Returns None if the exchange stopped the search before an answer.
         """
+        assumptions = list(assumptions)
+        self.model = None
+        self.failed = []
+        if not self.ok:
+            # Empty clause or contradicting unit clauses in the input
+            return False
+
+        sat = self.search(assumptions)
+        if sat:
+            # DIMACS model: for each v in 1..num_vars:
+            #  - v  if variable v is True
+            #  - -v if variable v is False or unassigned (default false)
+            assigns = self.assigns
+            self.model = [v if assigns[v] is True else -v for v in range(1, self.num_vars + 1)]
+        self.cancel_until(0)
+
+        if assumptions:
+            negated = {neg(p) for p in assumptions}
+            arena = self.arena
+            self.remove_learnts([c for c in self.learnts
+                                 if any(arena[k] in negated
+                                        for k in range(c + HEADER, c + HEADER + arena[c + SIZE]))])
+        return sat
+
+    def search(self, assumptions: List[int]) -> bool | None:
+        assumption_level = 1 if assumptions else 0
+        self.assumption_level = assumption_level
+        exchange = self.exchange
         while True:
             confl = self.propagate()
             if confl is not None:
                 # Conflict
+                self.conflicts += 1
+                if exchange is not None and self.conflicts % 256 == 0 and exchange.stopped():
+                    return None
                 if self.current_level() == 0:
-                    # Conflict at root level -> UNSAT
+                    # Conflict at root level -> UNSAT, whatever the assumptions
+                    self.ok = False
+                    return False
+                if self.current_level() == assumption_level:
+                    # Conflict under the assumptions alone
+                    self.failed = self.analyze_final(self.clause_lits(confl))
                     return False
 
                 learnt, backtrack_level = self.analyze(confl)
+                self.order.decay()
+                self.cla_inc /= self.clause_decay
                 # Add learned clause
-                self.clauses.append(learnt)
+                reason = NO_REASON
+                if len(learnt) > 1:
+                    lbd = self.compute_lbd(learnt, 0, len(learnt))
+                    reason = self.alloc(learnt, lbd, learnt=True)
+                    self.bump_clause(reason)
+                    self.learnts.append(reason)
+                    self.attach_clause(reason)
+                    self.restart_policy.on_conflict(lbd)
+                else:
+                    lbd = 1
+                    self.restart_policy.on_conflict(1)
+                if exchange is not None:
+                    exchange.export(learnt, lbd)
                 # Backjump
                 self.cancel_until(backtrack_level)
                 # Enqueue the asserting literal of the learned clause
-                asserting_lit = learnt[-1]  # last literal is neg(p)
-                self.enqueue(asserting_lit, learnt)
+                asserting_lit = learnt[0]  # first literal is neg(p)
+                self.enqueue(asserting_lit, reason)
+
+                if self.conflicts >= self.next_reduce:
+                    self.reduce_db()
+                    self.reduce_interval += self.reduce_inc
+                    self.next_reduce = self.conflicts + self.reduce_interval
 
             else:
+                if self.restart_policy.should_restart():
+                    # Restart: undo all decisions but the assumptions, keep
+                    # learned clauses and activities
+                    self.restart_policy.on_restart()
+                    self.cancel_until(assumption_level)
+                    if exchange is not None:
+                        if exchange.stopped():
+                            return None
+                        if self.current_level() == 0:
+                            for lits, lbd in exchange.imports():
+                                self.add_shared(lits, lbd)
+                            if not self.ok:
+                                return False
+                    continue
+
+                if self.current_level() < assumption_level:
+                    # Decide the assumptions, again after a learned unit
+                    self.decisions += 1
+                    self.new_decision_level()
+                    for p in assumptions:
+                        val = self.value_lit(p)
+                        if val is False:
+                            self.failed = [p] + self.analyze_final([p])
+                            return False
+                        if val is None:
+                            self.enqueue(p, NO_REASON)
+                    continue
+
                 # No conflict: check if all variables are assigned
                 all_assigned = True
                 for v in range(1, self.num_vars + 1):
@@ -293,39 +966,63 @@ class CDCLSolver:
                     # Nothing left to assign -> SAT
                     return True
 
+                self.decisions += 1
                 self.new_decision_level()
-                decision_lit = next_var  # choose positive polarity
-                self.enqueue(decision_lit, None)
+                # Use the saved phase, so restarts do not lose the partial assignment
+                decision_lit = next_var if self.phase[next_var] else neg(next_var)
+                self.enqueue(decision_lit, NO_REASON)
 
 
 # ------------------------------
 # Top-level API for the assignment
 # ------------------------------
 
-def solve_cnf(clauses: Iterable[Iterable[int]], num_vars: int) -> Tuple[str, List[int] | None]:
+def solve_cnf(clauses: Iterable[Iterable[int]], num_vars: int, order: str = "vsids",
+              restart: str = "glucose", preprocess: bool = False,
+              workers: int = 1, cube_depth: int = 0) -> Tuple[str, List[int] | None]:
     """
     Entry point for the SAT solver.
 
     Must return:
       ("SAT", model)  where model is a list of ints (DIMACS-style), or
       ("UNSAT", None)
+
+    With preprocess, the formula is simplified first (see src/preprocess.py),
+    and the model is extended back to the variables it removed. It is off by
+    default: on the Sudoku encodings the solver's own propagation of the
+    clues does most of what it does, and the search often ends up slower.
+
+    With more than one worker, the formula is solved by a
+    portfolio of that many solvers in parallel processes (see portfolio.py).
+    With a cube_depth, it is split into up to 2**cube_depth cubes instead,
+    which the workers solve by cube-and-conquer (see cube.py).
     """
     clause_list = [list(cl) for cl in clauses]
 
-    solver = CDCLSolver(clause_list, num_vars)
-    sat = solver.solve()
+    preprocessor = None
+    if preprocess:
+        preprocessor = Preprocessor(clause_list, num_vars)
+        if not preprocessor.run():
+            return "UNSAT", None
+        clause_list = preprocessor.simplified()
+
+    if cube_depth > 0:
+        from cube import solve_cubes
+        status, model = solve_cubes(clause_list, num_vars, workers, cube_depth, order, restart)
+        sat = status == "SAT"
+    elif workers > 1:
+        from portfolio import portfolio_configs, solve_portfolio
+        status, model = solve_portfolio(clause_list, num_vars,
+                                        configs=portfolio_configs(workers, order, restart))
+        sat = status == "SAT"
+    else:
+        solver = CDCLSolver(clause_list, num_vars, order, restart=restart)
+        sat = solver.solve()
+        model = solver.model
 
     if sat:
-        # DIMACS model: for each v in 1..num_vars:
-        #  - v  if variable v is True
-        #  - -v if variable v is False or unassigned (default false)
-        model: List[int] = []
-        for v in range(1, num_vars + 1):
-            val = solver.assigns[v]
-            if val is True:
-                model.append(v)
-            else:
-                model.append(-v)
+        if preprocessor is not None:
+            model = preprocessor.extend_model(model)
         return "SAT", model
     else:
         return "UNSAT", None
\ No newline at end of file
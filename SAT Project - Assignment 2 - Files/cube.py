@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Cube-and-conquer: the formula is split into cubes, sets of literals that
+together cover every assignment, and the cubes are solved in parallel
+processes, each as the assumptions of an incremental CDCLSolver.
+
+The cuber (make_cubes) builds a binary tree of a given depth by lookahead:
+at every node, the candidate variables are each assigned both ways and
+propagated, and the node branches on the variable whose two sides assign
+the most (the product of both counts, as in march). A side that fails is a
+failed literal, so the other side is implied and added to the cube, and a
+node with a failed variable is refuted there and dropped. The leaves are
+the cubes.
+
+The workers share one counter of the next cube to solve, so a worker that
+finishes early takes more cubes and none is left waiting on a busy one.
+Every worker keeps its solver, and so its learned clauses, from one cube
+to the next, and shares its short learned clauses with the others through
+the buffers of portfolio.py, which it reads before every cube.
+
+The answer is SAT as soon as a cube has a model, and UNSAT once every cube
+is refuted, or as soon as a worker finds the formula itself UNSAT.
+
+Usage:
+  python cube.py --in <puzzle.txt> [-j WORKERS] [-d DEPTH]
+"""
+
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from typing import Iterable, List, Tuple
+
+from ameebaby import CDCLSolver, NO_REASON, neg
+from portfolio import ClauseBuffer, Exchange, stop_workers
+
+
+def occurrence_order(clauses: List[List[int]], num_vars: int) -> List[int]:
+    """
+    Variables that occur in clauses, the most frequent first
+    """
+    counts = [0] * (num_vars + 1)
+    for clause in clauses:
+        for lit in clause:
+            counts[abs(lit)] += 1
+    return sorted((v for v in range(1, num_vars + 1) if counts[v]), key=lambda v: -counts[v])
+
+
+def lookahead(solver: CDCLSolver, candidates: List[int], limit: int,
+              implied: List[int]) -> Tuple[bool, int | None]:
+    """
+    Look ahead on the first limit unassigned candidates at the current
+    decision level. Failed literals are negated, assigned and appended to
+    implied.
+
+    Returns (False, None) if the node is refuted, else (True, v) with v the
+    variable to branch on, None if every candidate is assigned.
+    """
+    level = solver.current_level()
+    best, best_score = None, -1
+    looked = 0
+    for v in candidates:
+        if looked == limit:
+            break
+        if solver.assigns[v] is not None:
+            continue
+        looked += 1
+
+        counts = []
+        for lit in (v, neg(v)):
+            solver.new_decision_level()
+            before = len(solver.trail)
+            solver.enqueue(lit, NO_REASON)
+            confl = solver.propagate()
+            counts.append(len(solver.trail) - before)
+            solver.cancel_until(level)
+            if confl is not None:
+                # Failed literal: its negation holds in the whole subtree
+                solver.enqueue(neg(lit), NO_REASON)
+                implied.append(neg(lit))
+                if solver.propagate() is not None:
+                    return False, None
+                break
+        else:
+            score = counts[0] * counts[1] + counts[0] + counts[1]
+            if score > best_score:
+                best, best_score = v, score
+    return True, best
+
+
+def make_cubes(clauses: List[List[int]], num_vars: int, depth: int,
+               candidates: int = 32) -> List[List[int]]:
+    """
+    Split the formula into at most 2**depth cubes, looking ahead on the
+    candidates most frequent unassigned variables at every node. An empty
+    list means the formula is UNSAT.
+    """
+    solver = CDCLSolver(clauses, num_vars)
+    if not solver.ok or solver.propagate() is not None:
+        return []
+    order = occurrence_order(clauses, num_vars)
+
+    cubes = []
+    # Explicit stack of (cube so far, remaining depth, branch literal or
+    # None for the root), with the decision level each entry starts from
+    stack = [([], depth, None, 0)]
+    while stack:
+        cube, remaining, lit, level = stack.pop()
+        solver.cancel_until(level)
+        if lit is not None:
+            solver.new_decision_level()
+            solver.enqueue(lit, NO_REASON)
+            if solver.propagate() is not None:
+                continue
+            cube = cube + [lit]
+        if remaining == 0:
+            cubes.append(cube)
+            continue
+
+        implied: List[int] = []
+        alive, v = lookahead(solver, order, candidates, implied)
+        if not alive:
+            continue
+        cube = cube + implied
+        if v is None:
+            cubes.append(cube)
+            continue
+        node_level = solver.current_level()
+        stack.append((cube, remaining - 1, neg(v), node_level))
+        stack.append((cube, remaining - 1, v, node_level))
+    return cubes
+
+
+def run_worker(index, config, clauses, num_vars, cubes, next_cube, buffers, stop, results,
+               max_lbd, max_size):
+    try:
+        solver = CDCLSolver(clauses, num_vars, **config)
+        exchange = Exchange(index, buffers, stop, max_lbd, max_size)
+        solver.exchange = exchange
+        while not stop.is_set():
+            with next_cube.get_lock():
+                cube_index = next_cube.value
+                next_cube.value += 1
+            if cube_index >= len(cubes):
+                return
+
+            for lits, lbd in exchange.imports():
+                solver.add_shared(lits, lbd)
+            sat = solver.solve(cubes[cube_index])
+            if sat is None:
+                # Stopped, another worker answered
+                return
+            if sat:
+                results.put((index, cube_index, "SAT", solver.model))
+            elif not solver.ok:
+                # UNSAT without the cube
+                results.put((index, cube_index, "UNSAT", None))
+            else:
+                results.put((index, cube_index, "REFUTED", None))
+    except Exception:
+        results.put((index, None, "ERROR", traceback.format_exc()))
+
+
+def solve_cubes(clauses: Iterable[Iterable[int]], num_vars: int, workers: int | None = None,
+                depth: int | None = None, order: str = "vsids", restart: str = "glucose",
+                buffer_size: int = 1 << 16, max_lbd: int = 2, max_size: int = 8,
+                grace: float = 1.0) -> Tuple[str, List[int] | None]:
+    """
+    Solve by cube-and-conquer with workers processes (os.cpu_count() by
+    default), and return ("SAT", model) or ("UNSAT", None) as solve_cnf does.
+
+    depth is the depth of the cube tree, by default enough for about 16
+    cubes per worker. The other arguments are as for solve_portfolio.
+    RuntimeError is raised if a worker fails, as its cube is then unknown.
+    """
+    workers = workers or os.cpu_count() or 1
+    if depth is None:
+        depth = math.ceil(math.log2(workers)) + 4
+    clause_list = [list(clause) for clause in clauses]
+
+    start = time.perf_counter()
+    cubes = make_cubes(clause_list, num_vars, depth)
+    logging.info(f"Cubes: {len(cubes)} of depth {depth}, in {time.perf_counter() - start:.3f} s")
+    if not cubes:
+        return "UNSAT", None
+
+    ctx = multiprocessing.get_context()
+    workers = min(workers, len(cubes))
+    buffers = [ClauseBuffer(ctx, buffer_size) for _ in range(workers)]
+    next_cube = ctx.Value('i', 0)
+    stop = ctx.Event()
+    results = ctx.Queue()
+    config = {"order": order, "restart": restart}
+    processes = [ctx.Process(target=run_worker,
+                             args=(index, config, clause_list, num_vars, cubes, next_cube,
+                                   buffers, stop, results, max_lbd, max_size),
+                             daemon=True)
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    refuted = 0
+    try:
+        while True:
+            try:
+                index, cube_index, status, payload = results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    raise RuntimeError(f"cube workers exited with {len(cubes) - refuted} cubes open")
+                continue
+            if status == "ERROR":
+                raise RuntimeError(f"cube worker {index} failed:\n{payload}")
+            if status == "REFUTED":
+                refuted += 1
+                if refuted < len(cubes):
+                    continue
+                status = "UNSAT"
+            logging.info(f"Cube worker {index} answered {status} on cube {cube_index}, "
+                         f"{refuted} of {len(cubes)} cubes refuted")
+            return status, payload
+    finally:
+        stop_workers(processes, stop, results, grace)
+
+
+def main():
+    from encoder import to_cnf
+
+    p = argparse.ArgumentParser()
+    p.add_argument("--in", dest="inp", required=True)
+    p.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                   help="number of solvers running in parallel")
+    p.add_argument("-d", "--depth", type=int, default=None, help="depth of the cube tree")
+    p.add_argument("-v", "--verbose", action="store_true", help="log the cubes and the answer")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARN)
+
+    clauses, num_vars = to_cnf(args.inp)
+    status, _ = solve_cubes(clauses, num_vars, args.workers, args.depth)
+    print(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -44,10 +44,138 @@ def read_puzzle(input_path: str):
     return grid, len(grid)
 
 
-def exactly_one(literals):
+class AuxVars:
+    """
+    Allocates the auxiliary variables of the AMO encodings, numbered after
+    the N^3 block of var(r,c,v,N)
+    """
+
+    def __init__(self, N):
+        self.count = N*N*N
+
+    def new(self):
+        self.count += 1
+        return self.count
+
+
+def amo_pairwise(literals, aux):
+    """
+    At most one: one binary clause per pair, O(n^2) clauses and no new variables
+    """
+    clauses = []
+    for i in range(len(literals)):
+        for j in range(i+1, len(literals)):
+            clauses.append([-literals[i], -literals[j]])
+    return clauses
+
+
+def amo_sequential(literals, aux):
+    """
+    At most one with a sequential counter (Sinz): s_i is true when one of the
+    first i literals is true. 3n-4 clauses and n-1 new variables.
+    """
+    n = len(literals)
+    if n <= 1:
+        return []
+
+    clauses = []
+    s = [aux.new() for _ in range(n-1)]
+    clauses.append([-literals[0], s[0]])
+    for i in range(1, n-1):
+        clauses.append([-literals[i], s[i]])
+        clauses.append([-s[i-1], s[i]])
+        clauses.append([-literals[i], -s[i-1]])
+    clauses.append([-literals[n-1], -s[n-2]])
+    return clauses
+
+
+def amo_commander(literals, aux, group_size=3):
+    """
+    At most one with commander variables (Klieber and Kwon): the literals are
+    split in groups, pairwise inside every group, every literal implies the
+    commander of its group, and at most one commander is true (recursively).
+    """
+    if len(literals) <= group_size + 2:
+        return amo_pairwise(literals, aux)
+
+    clauses = []
+    commanders = []
+    for start in range(0, len(literals), group_size):
+        group = literals[start:start+group_size]
+        commander = aux.new()
+        commanders.append(commander)
+        clauses += amo_pairwise(group, aux)
+        for lit in group:
+            clauses.append([-lit, commander])
+    clauses += amo_commander(commanders, aux, group_size)
+    return clauses
+
+
+def amo_product(literals, aux):
+    """
+    At most one with the product encoding (Chen): the literals are laid out
+    on a p x q grid, every literal implies its row and its column variable,
+    and at most one row and one column variable are true (recursively).
+    About 2n + O(sqrt(n)) clauses.
+    """
+    n = len(literals)
+    if n <= 6:
+        return amo_pairwise(literals, aux)
+
+    p = math.ceil(math.sqrt(n))
+    q = math.ceil(n / p)
+    rows = [aux.new() for _ in range(p)]
+    cols = [aux.new() for _ in range(q)]
+
+    clauses = []
+    for idx, lit in enumerate(literals):
+        clauses.append([-lit, rows[idx // q]])
+        clauses.append([-lit, cols[idx % q]])
+    clauses += amo_product(rows, aux)
+    clauses += amo_product(cols, aux)
+    return clauses
+
+
+def amo_bimander(literals, aux, group_size=2):
+    """
+    At most one with the bimander encoding (Nguyen and Mai): the literals are
+    split in groups, pairwise inside every group, and every literal implies
+    the binary code of its group index on log2(#groups) new variables.
+    """
+    groups = math.ceil(len(literals) / group_size)
+    if groups <= 1:
+        return amo_pairwise(literals, aux)
+
+    bits = [aux.new() for _ in range(math.ceil(math.log2(groups)))]
+
+    clauses = []
+    for g in range(groups):
+        group = literals[g*group_size:(g+1)*group_size]
+        clauses += amo_pairwise(group, aux)
+        for lit in group:
+            for j, bit in enumerate(bits):
+                clauses.append([-lit, bit if (g >> j) & 1 else -bit])
+    return clauses
+
+
+# At-most-one encodings that can be selected by name
+AMO_ENCODINGS = {
+    "pairwise": amo_pairwise,
+    "sequential": amo_sequential,
+    "commander": amo_commander,
+    "product": amo_product,
+    "bimander": amo_bimander,
+}
+
+
+def exactly_one(literals, amo="pairwise", aux=None):
     """
     Given all encoded literals of a cell
-    Return a list of clauses relating to the literals"""
+    Return a list of clauses relating to the literals
+
+    amo selects the at-most-one encoding (see AMO_ENCODINGS). Every encoding
+    but pairwise needs aux to allocate its new variables.
+    """
 
 
     clauses = []
@@ -56,9 +184,7 @@ def exactly_one(literals):
     clauses.append(literals)
 
     # At most one number per cell
-    for i in range(len(literals)):
-        for j in range(i+1, len(literals)):
-            clauses.append([-literals[i], -literals[j]])
+    clauses += AMO_ENCODINGS[amo](literals, aux)
     
     return clauses
 
@@ -69,16 +195,153 @@ def exactly_one(literals):
 
 
 
-def to_cnf(input_path: str) -> Tuple[Iterable[Iterable[int]], int]:
+def sudoku_units(N):
     """
-    Read puzzle from input_path and return (clauses, num_vars).
+    Return the rows, columns and boxes of the grid, each as a list of cells (r, c)
+    """
+    B = int(math.sqrt(N))
+    units = []
+    for r in range(N):
+        units.append([(r, c) for c in range(N)])
+    for c in range(N):
+        units.append([(r, c) for r in range(N)])
+    for box_r in range(B):
+        for box_c in range(B):
+            units.append([(r, c) for r in range(box_r*B, (box_r+1)*B)
+                          for c in range(box_c*B, (box_c+1)*B)])
+    return units
 
-    - clauses: iterable of iterables of ints (each clause), no trailing 0s
-    - num_vars: must be N^3 with N = grid size
+
+def neighbours(r, c, N):
+    """
+    Return the orthogonal neighbours of cell (r, c)
     """
+    cells = []
+    for dr, dc in [(-1,0), (1,0), (0,-1), (0,1)]:
+        nr, nc = r + dr, c + dc
+        if 0 <= nr < N and 0 <= nc < N:
+            cells.append((nr, nc))
+    return cells
 
-    grid, N = read_puzzle(input_path) 
+
+def propagate_givens(grid, N):
+    """
+    Return the candidate values of every cell after propagating the clues:
+    a placed value is removed from the other cells of its row, column and
+    box, and its consecutive values from its orthogonal neighbours. A cell
+    with a single candidate left (naked single), and a value with a single
+    cell left in a row, column or box (hidden single), are placed in turn.
+
+    Return None if the clues contradict each other.
+    """
+    units = sudoku_units(N)
+    peers = {}
+    for unit in units:
+        for cell in unit:
+            peers.setdefault(cell, set()).update(unit)
+    for cell, cells in peers.items():
+        cells.discard(cell)
+
+    candidates = {(r, c): set(range(1, N+1)) for r in range(N) for c in range(N)}
+    placed = {}
+    queue = [((r, c), grid[r][c]) for r in range(N) for c in range(N) if grid[r][c] > 0]
+
+    def eliminate(cell, v):
+        if v in candidates[cell]:
+            candidates[cell].discard(v)
+            if len(candidates[cell]) == 1 and cell not in placed:
+                queue.append((cell, next(iter(candidates[cell]))))
+        return len(candidates[cell]) > 0
+
+    while True:
+        while queue:
+            cell, v = queue.pop()
+            if cell in placed:
+                if placed[cell] != v:
+                    return None
+                continue
+            if v not in candidates[cell]:
+                return None
+            placed[cell] = v
+            candidates[cell] = {v}
+            for other in peers[cell]:
+                if not eliminate(other, v):
+                    return None
+            for other in neighbours(cell[0], cell[1], N):
+                if not eliminate(other, v-1) or not eliminate(other, v+1):
+                    return None
+
+        # Hidden singles
+        for unit in units:
+            for v in range(1, N+1):
+                cells = [cell for cell in unit if v in candidates[cell]]
+                if not cells:
+                    return None
+                if len(cells) == 1 and cells[0] not in placed:
+                    queue.append((cells[0], v))
+        if not queue:
+            return candidates
+
+
+def reduced_cnf(grid, N, amo):
+    """
+    Encode the puzzle over the candidates left by propagate_givens only.
+
+    Every placed cell gets a unit clause, and every candidate that was ruled
+    out a negative unit clause, so every var(r,c,v) keeps its meaning and
+    models decode as usual. The constraints (1)-(5) are only emitted for
+    cells and values that are still open.
+    """
+    aux = AuxVars(N)
+    candidates = propagate_givens(grid, N)
+    if candidates is None:
+        # Contradicting clues
+        x = var(0,0,1,N)
+        return [[x], [-x]], aux.count
+
+    clauses = []
+    for (r, c), values in candidates.items():
+        for v in range(1, N+1):
+            if v not in values:
+                clauses.append([-var(r,c,v,N)])
+        if len(values) == 1:
+            clauses.append([var(r,c,next(iter(values)),N)])
+
+    # (1) Exactly one value per open cell
+    for (r, c), values in candidates.items():
+        if len(values) > 1:
+            clauses += exactly_one([var(r,c,v,N) for v in sorted(values)], amo, aux)
+
+    # (2)-(4) Exactly one cell for every value not yet placed in a row, column or box
+    for unit in sudoku_units(N):
+        for v in range(1, N+1):
+            cells = [cell for cell in unit if v in candidates[cell]]
+            if len(cells) > 1:
+                clauses += exactly_one([var(r,c,v,N) for r, c in cells], amo, aux)
+
+    # (5) Non-consecutive rule between open neighbours, once per pair of cells
+    for (r, c), values in candidates.items():
+        if len(values) == 1:
+            continue
+        for nr, nc in neighbours(r, c, N):
+            other = candidates[(nr, nc)]
+            if (nr, nc) < (r, c) or len(other) == 1:
+                continue
+            for v in values:
+                for w in (v-1, v+1):
+                    if w in other:
+                        clauses.append([-var(r,c,v,N), -var(nr,nc,w,N)])
+
+    return clauses, aux.count
+
+
+def base_cnf(N, amo="pairwise"):
+    """
+    Return (clauses, num_vars) of the constraints (1)-(5), which are the
+    same for every puzzle of size N, so they can be shared by all of them
+    """
     B = int(math.sqrt(N))
+    aux = AuxVars(N)
 
     clauses = []
 
@@ -86,21 +349,21 @@ def to_cnf(input_path: str) -> Tuple[Iterable[Iterable[int]], int]:
     for r in range(N):
         for c in range(N):
             literals = [var(r,c,v,N) for v in range(1, N+1)]
-            clauses += exactly_one(literals)
+            clauses += exactly_one(literals, amo, aux)
     
     # (2) Row constraint: 
     # For each value v and each row r: exactly one column c has v
     for r in range(N):
         for v in range(1, N+1):
             literals = [var(r,c,v,N) for c in range(N)]
-            clauses += exactly_one(literals)
+            clauses += exactly_one(literals, amo, aux)
     
     # (3) Column constraint:
     # For each value v and each column c: exactly one row r has v
     for c in range(N):
         for v in range(1, N+1):
             literals = [var(r,c,v,N) for r in range(N)]
-            clauses += exactly_one(literals)
+            clauses += exactly_one(literals, amo, aux)
 
     # (4) Box constraint:
     for box_r in range(B):
@@ -110,7 +373,7 @@ def to_cnf(input_path: str) -> Tuple[Iterable[Iterable[int]], int]:
                 for r in range(box_r*B, (box_r+1)*B):
                     for c in range(box_c*B, (box_c+1)*B):
                         literals.append(var(r,c,v,N))
-                clauses += exactly_one(literals)
+                clauses += exactly_one(literals, amo, aux)
     
     # (5) Non-consecutive rule
     for r in range(N):
@@ -125,16 +388,39 @@ def to_cnf(input_path: str) -> Tuple[Iterable[Iterable[int]], int]:
                         if v < N:
                             clauses.append([-current, -var(nr,nc,v+1,N)])
 
+    return clauses, aux.count
+
+
+def clue_literals(grid, N):
+    """
+    Return the literal var(r,c,v) of every given of the puzzle
+    """
+    return [var(r,c,grid[r][c],N) for r in range(N) for c in range(N) if grid[r][c] > 0]
+
+
+def to_cnf(input_path: str, amo: str = "pairwise", reduced: bool = False) -> Tuple[Iterable[Iterable[int]], int]:
+    """
+    Read puzzle from input_path and return (clauses, num_vars).
+
+    - clauses: iterable of iterables of ints (each clause), no trailing 0s
+    - num_vars: N^3 with N = grid size, plus the auxiliary variables of the
+      at-most-one encoding amo (none for the default pairwise encoding)
+
+    With reduced, the clues are propagated first and only the candidates
+    that are still possible are encoded (see reduced_cnf).
+    """
+
+    grid, N = read_puzzle(input_path) 
+    if reduced:
+        return reduced_cnf(grid, N, amo)
+
+    # (1)-(5) are the same for every puzzle of size N, see encoder_cache.py
+    from encoder_cache import cached_base_cnf
+    base, num_vars = cached_base_cnf(N, amo)
+    clauses = list(base)
+
     # (6) Unit clauses
-    for r in range(N):
-        for c in range(N):
-            v = grid[r][c]
-            if v > 0:
-                clauses.append([var(r,c,v,N)])
-    
-    ## Write output file
-    num_vars = N*N*N
-    num_clauses = len(clauses)
+    clauses += [[lit] for lit in clue_literals(grid, N)]
 
     return clauses, num_vars
 
@@ -0,0 +1,136 @@
+"""
+Cache of encoder.base_cnf, the constraints (1)-(5) that every puzzle of a
+given size N shares, so that to_cnf only has to add the clues.
+
+The base CNF of the capacity most recently used (N, amo) pairs is kept in
+memory, and every one is also stored on disk in the binary CNF format of
+src/bincnf.py, so other processes and later runs load it instead of
+encoding it again. A file that is missing, of another version or damaged
+is encoded and written again.
+
+The directory is SUDOKU_CNF_CACHE from the environment if it is set, else
+~/.cache/sudoku-cnf. Bump ENCODING_VERSION whenever base_cnf changes, so
+the files of the old encoding are not used anymore.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+from array import array
+from collections import OrderedDict
+
+from encoder import base_cnf
+
+# The binary CNF format lives with the rest of the SAT solver in src/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from bincnf import BinaryFormatError, read_bincnf, write_bincnf
+from dimacs import CNF
+
+ENCODING_VERSION = 1
+
+# The umask can only be read by setting it, so once, at import
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+CACHE_DIR = os.environ.get("SUDOKU_CNF_CACHE",
+                           os.path.join(os.path.expanduser("~"), ".cache", "sudoku-cnf"))
+
+
+class BaseCNFCache:
+    """
+    directory: where the base CNFs are stored, None to keep them in memory only
+    capacity:  number of base CNFs kept in memory
+    """
+
+    def __init__(self, directory=CACHE_DIR, capacity=4):
+        self.directory = directory
+        self.capacity = capacity
+        # (N, amo) -> (clauses as tuples, num_vars), least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.loads = 0
+        self.builds = 0
+
+    def stats(self):
+        return {"hits": self.hits, "loads": self.loads, "builds": self.builds}
+
+    def location(self, N, amo):
+        return os.path.join(self.directory, f"base-{N}-{amo}-v{ENCODING_VERSION}.cnfb")
+
+    def get(self, N, amo="pairwise"):
+        """
+        Return (clauses, num_vars) of base_cnf(N, amo), with every clause a
+        tuple, as the clauses are shared by all callers
+        """
+        key = (N, amo)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        entry = self.load(N, amo)
+        if entry is None:
+            self.builds += 1
+            clauses, num_vars = base_cnf(N, amo)
+            entry = [tuple(clause) for clause in clauses], num_vars
+            self.store(N, amo, clauses, num_vars)
+        else:
+            self.loads += 1
+
+        self.entries[key] = entry
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return entry
+
+    def load(self, N, amo):
+        if self.directory is None:
+            return None
+        try:
+            cnf = read_bincnf(self.location(N, amo))
+        except FileNotFoundError:
+            return None
+        except (OSError, BinaryFormatError) as e:
+            logging.warning(f"Encoding again the base CNF of N={N}, {amo}: {e}")
+            return None
+
+        lits = cnf.lits.tolist()
+        offsets = cnf.offsets.tolist()
+        return [tuple(lits[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)], cnf.num_vars
+
+    def store(self, N, amo, clauses, num_vars):
+        if self.directory is None:
+            return
+        lits = array('i')
+        offsets = array('i', [0])
+        for clause in clauses:
+            lits.extend(clause)
+            offsets.append(len(lits))
+
+        # Written under a temporary name and renamed, so that processes
+        # running at the same time never read a partly written file
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            os.close(fd)
+            try:
+                write_bincnf(temp, CNF(num_vars, len(clauses), lits, offsets))
+                # mkstemp makes the file private, but the cache may be shared
+                os.chmod(temp, 0o644 & ~UMASK)
+                os.replace(temp, self.location(N, amo))
+            finally:
+                if os.path.exists(temp):
+                    os.remove(temp)
+        except OSError as e:
+            logging.warning(f"Could not store the base CNF of N={N}, {amo}: {e}")
+
+
+# Cache used by encoder.to_cnf
+BASE_CACHE = BaseCNFCache()
+
+
+def cached_base_cnf(N, amo="pairwise"):
+    """
+    base_cnf(N, amo) from BASE_CACHE
+    """
+    return BASE_CACHE.get(N, amo)
@@ -0,0 +1,102 @@
+"""
+Vectorized version of encoder.to_cnf, built with NumPy.
+
+Every constraint family is produced as one int32 array of literals with
+broadcasting instead of Python loops, and the result is a dimacs.CNF: a flat
+literal buffer plus clause offsets, which Loader.load_cnf, the Preprocessor
+and CNF.clauses() all take directly.
+
+The formula is the same as the default (pairwise) encoding of encoder.to_cnf,
+with the same var(r,c,v) numbering, except that the non-consecutive clauses
+are emitted once per pair of neighbouring cells instead of twice.
+
+NumPy is only needed for this module, the rest of the project runs without it.
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+
+from encoder import read_puzzle
+
+# The CNF buffers live with the rest of the SAT solver in src/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from dimacs import CNF
+
+
+def variables(N):
+    """
+    Return the N x N x N array V with V[r, c, v-1] == var(r,c,v,N)
+    """
+    return np.arange(1, N**3 + 1, dtype=np.int32).reshape(N, N, N)
+
+
+def groups(V, N):
+    """
+    Return the literals of every exactly-one constraint (1)-(4) as the rows
+    of a (4*N*N, N) array: cells, then rows, columns and boxes per value
+    """
+    B = int(math.sqrt(N))
+    cells = V.reshape(N*N, N)
+    rows = V.transpose(0, 2, 1).reshape(N*N, N)
+    cols = V.transpose(1, 2, 0).reshape(N*N, N)
+    boxes = V.reshape(B, B, B, B, N).transpose(0, 2, 4, 1, 3).reshape(N*N, N)
+    return np.concatenate([cells, rows, cols, boxes])
+
+
+def at_most_one(G, N):
+    """
+    Pairwise at-most-one clauses of every row of G, as a (rows * N(N-1)/2, 2) array
+    """
+    i, j = np.triu_indices(N, 1)
+    return np.stack([-G[:, i], -G[:, j]], axis=-1).reshape(-1, 2)
+
+
+def non_consecutive(V, N):
+    """
+    Binary clauses forbidding consecutive values in orthogonal neighbours,
+    once per pair of cells, as an (M, 2) array
+    """
+    pairs = []
+    for A, C in ((V[:, :-1], V[:, 1:]), (V[:-1, :], V[1:, :])):
+        # A and C are neighbouring cells, the last axis is the value
+        pairs.append(np.stack([-A[..., :-1], -C[..., 1:]], axis=-1).reshape(-1, 2))
+        pairs.append(np.stack([-A[..., 1:], -C[..., :-1]], axis=-1).reshape(-1, 2))
+    return np.concatenate(pairs)
+
+
+def clues(V, grid):
+    """
+    Unit clauses of the givens, as a 1-D array
+    """
+    grid = np.asarray(grid, dtype=np.int32)
+    r, c = np.nonzero(grid)
+    return V[r, c, grid[r, c] - 1]
+
+
+def to_cnf_arrays(input_path: str) -> CNF:
+    """
+    Read puzzle from input_path and return its encoding as a dimacs.CNF
+    with NumPy buffers (int32 literals, int64 offsets)
+    """
+    grid, N = read_puzzle(input_path)
+    V = variables(N)
+
+    G = groups(V, N)
+    amo = at_most_one(G, N)
+    adjacent = non_consecutive(V, N)
+    units = clues(V, grid)
+
+    lits = np.concatenate([G.ravel(), amo.ravel(), adjacent.ravel(), units])
+
+    lengths = np.concatenate([
+        np.full(len(G), N, dtype=np.int64),
+        np.full(len(amo) + len(adjacent), 2, dtype=np.int64),
+        np.ones(len(units), dtype=np.int64),
+    ])
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    return CNF(N**3, len(lengths), lits, offsets)
@@ -17,8 +17,14 @@ Behavior:
 """
 
 import argparse
+import os
+import sys
 from typing import Tuple, Iterable
 from encoder import to_cnf
+
+# The DIMACS reader lives with the rest of the SAT solver in src/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from dimacs import read_dimacs
 from solver import solve_cnf
 
 def parse_args():
@@ -41,40 +47,14 @@ def main():
 
 
 def parse_dimacs(input_path: str) -> Tuple[Iterable[Iterable[int]], int]:
-    close = False
-    if isinstance(input_path, str):
-        file = open(input_path, "r")
-        close = True
-    else:
-        file = input_path
-
+    # Shared streaming reader, also accepts .cnf.gz / .cnf.xz / .cnf.bz2 files
+    cnf = read_dimacs(input_path)
 
-    line = file.readline()
-
-    components = line.strip().split(" ")
-
-    if len(components)!= 4 or components[0]!="p" or components[1]!="cnf":
+    if cnf.declared_clauses is None:
       print("Wrong file format! Expected first line to be 'p cnf NUM_VARS NUM_CLAUSES")
       exit(1)
 
-    num_vars=int(components[2])
-    num_clauses=int(components[3])
-
-    clauses=[]
-
-    line=file.readline()
-    while(line):
-       numbers = [int(x) for x in line.strip().split(" ")]
-
-       if(numbers[-1]!=0):
-          print("Wrong format! Clause lines must be terminated with a 0")
-
-       clauses.append(numbers[:-1])
-
-       line=file.readline()
-
-
-    return clauses, num_vars
+    return list(cnf.clauses()), cnf.num_vars
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Portfolio solving: several differently configured CDCLSolvers run on the
+same formula in parallel processes, and the first answer wins.
+
+Worker 0 runs the configuration asked for, exactly as solve_cnf would run it
+alone. The others get other restart policies and a seed, which starts them
+with a random variable order and random phases (see portfolio_configs).
+
+The workers share their short learned clauses: units, binaries, and
+clauses of at most max_size literals with an LBD of at most max_lbd. Every
+worker writes them to its own ClauseBuffer, a ring of integers in shared
+memory, and reads the buffers of the others at its restarts. A buffer has
+a fixed size, so a worker that reads too rarely misses the clauses that
+were overwritten in the meantime.
+
+When the first answer comes in, the others are told to stop through a
+shared event, which they check at restarts and every 256 conflicts. A
+worker that has not stopped after a grace period is terminated.
+
+Usage:
+  python portfolio.py --in <puzzle.txt> [-j WORKERS]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from typing import Dict, Iterable, List, Tuple
+
+from ameebaby import CDCLSolver
+
+# Restart policies of the workers after the first one, in turn
+RESTARTS = ("luby", "glucose", "geometric")
+
+
+class ClauseBuffer:
+    """
+    Learned clauses of one worker, in a ring of capacity integers in shared
+    memory. Every clause is written as its size, its LBD and its literals.
+    head counts all the integers written so far, so readers keep their own
+    position and only read what is new.
+    """
+
+    def __init__(self, ctx, capacity: int):
+        self.data = ctx.Array('i', capacity, lock=False)
+        self.head = ctx.Value('q', 0, lock=False)
+        self.lock = ctx.Lock()
+
+    def push(self, lits: List[int], lbd: int) -> None:
+        data = self.data
+        capacity = len(data)
+        if len(lits) + 2 > capacity:
+            return
+        with self.lock:
+            pos = self.head.value
+            data[pos % capacity] = len(lits)
+            data[(pos + 1) % capacity] = lbd
+            for i, lit in enumerate(lits, pos + 2):
+                data[i % capacity] = lit
+            self.head.value = pos + len(lits) + 2
+
+    def read(self, pos: int) -> Tuple[List[Tuple[List[int], int]], int]:
+        """
+        Return the clauses written since position pos as (lits, lbd) pairs,
+        and the position to read from next time
+        """
+        data = self.data
+        capacity = len(data)
+        with self.lock:
+            head = self.head.value
+            if head - pos > capacity:
+                # Overwritten before we got to it: skip to what is new
+                return [], head
+            start = pos % capacity
+            end = start + head - pos
+            if end <= capacity:
+                ints = data[start:end]
+            else:
+                ints = data[start:] + data[:end - capacity]
+
+        clauses = []
+        i = 0
+        while i < len(ints):
+            size = ints[i]
+            clauses.append((ints[i + 2:i + 2 + size], ints[i + 1]))
+            i += size + 2
+        return clauses, head
+
+
+class Exchange:
+    """
+    The exchange of one worker, see CDCLSolver.exchange
+    """
+
+    def __init__(self, index: int, buffers: List[ClauseBuffer], stop, max_lbd: int, max_size: int):
+        self.index = index
+        self.buffers = buffers
+        self.stop = stop
+        self.max_lbd = max_lbd
+        self.max_size = max_size
+        self.positions = [0] * len(buffers)
+        self.exported = 0
+
+    def export(self, lits: List[int], lbd: int) -> None:
+        if len(lits) <= 2 or (lbd <= self.max_lbd and len(lits) <= self.max_size):
+            self.buffers[self.index].push(lits, lbd)
+            self.exported += 1
+
+    def imports(self) -> Iterable[Tuple[List[int], int]]:
+        for j, buffer in enumerate(self.buffers):
+            if j != self.index:
+                clauses, self.positions[j] = buffer.read(self.positions[j])
+                yield from clauses
+
+    def stopped(self) -> bool:
+        return self.stop.is_set()
+
+
+def portfolio_configs(workers: int, order: str = "vsids", restart: str = "glucose") -> List[Dict]:
+    """
+    Keyword arguments of CDCLSolver for every worker: the given order and
+    restart policy first, then seeded solvers with the policies of RESTARTS
+    """
+    configs = [{"order": order, "restart": restart}]
+    for i in range(1, workers):
+        configs.append({"order": order, "restart": RESTARTS[(i - 1) % len(RESTARTS)], "seed": i})
+    return configs
+
+
+def run_worker(index, config, clauses, num_vars, buffers, stop, results, max_lbd, max_size):
+    try:
+        solver = CDCLSolver(clauses, num_vars, **config)
+        solver.exchange = Exchange(index, buffers, stop, max_lbd, max_size)
+        sat = solver.solve()
+        if sat is None:
+            # Stopped, another worker answered
+            return
+        stats = solver.stats()
+        stats["exported"] = solver.exchange.exported
+        results.put((index, "SAT" if sat else "UNSAT", solver.model, stats))
+    except Exception:
+        results.put((index, "ERROR", traceback.format_exc(), None))
+
+
+def stop_workers(processes, stop, results, grace: float) -> None:
+    """
+    Tell the worker processes to stop, and terminate the ones that have not
+    after grace seconds
+    """
+    stop.set()
+    # Keep reading the results of workers that answered too, as a worker
+    # cannot exit before the queue has taken what it put in
+    deadline = time.monotonic() + grace
+    while any(process.is_alive() for process in processes) and time.monotonic() < deadline:
+        try:
+            results.get(timeout=0.05)
+        except queue.Empty:
+            pass
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+
+def solve_portfolio(clauses: Iterable[Iterable[int]], num_vars: int, workers: int | None = None,
+                    configs: List[Dict] | None = None, buffer_size: int = 1 << 16,
+                    max_lbd: int = 2, max_size: int = 8,
+                    grace: float = 1.0) -> Tuple[str, List[int] | None]:
+    """
+    Solve with a portfolio of workers (os.cpu_count() by default) configured
+    by configs (portfolio_configs by default), and return the first answer
+    as solve_cnf does: ("SAT", model) or ("UNSAT", None).
+
+    buffer_size is the capacity in integers of the clause buffer of every
+    worker, and grace the time in seconds the workers get to stop.
+    RuntimeError is raised if every worker failed.
+    """
+    if configs is None:
+        configs = portfolio_configs(workers or os.cpu_count() or 1)
+    clause_list = [list(clause) for clause in clauses]
+
+    ctx = multiprocessing.get_context()
+    buffers = [ClauseBuffer(ctx, buffer_size) for _ in configs]
+    stop = ctx.Event()
+    results = ctx.Queue()
+    processes = [ctx.Process(target=run_worker,
+                             args=(index, config, clause_list, num_vars, buffers, stop,
+                                   results, max_lbd, max_size),
+                             daemon=True)
+                 for index, config in enumerate(configs)]
+    for process in processes:
+        process.start()
+
+    answer = None
+    errors = []
+    try:
+        while answer is None:
+            try:
+                index, status, payload, stats = results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    break
+                continue
+            if status == "ERROR":
+                logging.error(f"Portfolio worker {index} failed:\n{payload}")
+                errors.append(payload)
+                continue
+            logging.info(f"Portfolio worker {index} ({configs[index]}) answered {status}: {stats}")
+            answer = status, payload if status == "SAT" else None
+    finally:
+        stop_workers(processes, stop, results, grace)
+
+    if answer is None:
+        raise RuntimeError(f"every portfolio worker failed, the first with:\n{errors[0] if errors else ''}")
+    return answer
+
+
+def main():
+    from encoder import to_cnf
+
+    p = argparse.ArgumentParser()
+    p.add_argument("--in", dest="inp", required=True)
+    p.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                   help="number of solvers running in parallel")
+    p.add_argument("-v", "--verbose", action="store_true", help="log the answering worker")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARN)
+
+    clauses, num_vars = to_cnf(args.inp)
+    status, _ = solve_portfolio(clauses, num_vars, args.workers)
+    print(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,115 +6,162 @@ THIS is the file to edit.
 Implement: solve_cnf(clauses) -> (status, model_or_None)"""
 
 
-from typing import Iterable, List, Tuple
+from typing import Dict, Iterable, List, Tuple
 
 
-def simplify(clauses, assignment):
-    "With the current assignment, simplify the clauses."
-    new_clauses = []
-    for clause in clauses:
-        # Skip satidsfied clauses
-        if any((lit > 0 and assignment.get(lit, None)==True) or (lit < 0 and assignment.get(-lit, None)==False ) for lit in clause):
-            ### ERROR AT HERE
-            continue
-        # Remove falsified literals
-        new_clause = [lit for lit in clause if not(
-            (lit > 0 and assignment.get(lit, None)==False) or
-            (lit < 0 and assignment.get(-lit, None)==True))]
-        new_clauses.append(new_clause)
+# The value of literal lit is values[lit]: True, False or None if unassigned.
+# values has 2 * num_vars + 1 entries, so that the negative literals index
+# the upper half from the end, and values[lit] and values[-lit] are always
+# set together.
 
+def assign(values: List[bool | None], trail: List[int], lit: int) -> None:
+    values[lit] = True
+    values[-lit] = False
+    trail.append(lit)
 
-    return new_clauses
 
+def undo(values: List[bool | None], trail: List[int], pos: int) -> None:
+    "Unassign everything on the trail from position pos on."
+    for lit in trail[pos:]:
+        values[lit] = values[-lit] = None
+    del trail[pos:]
 
-def find_unit_clause(clauses):
-    for clause in clauses:
-        if len(clause) == 1:
-            return clause[0]
-    return None
-
-def find_pure_literal(clauses):
-    all_literals = {lit for clause in clauses for lit in clause}
-    for lit in all_literals:
-        if -lit not in all_literals:
-            return lit
-    return None
 
 def remove_tautologies(clauses):
-    """Remove any clause that contains both x and -x"""
+    """Remove any clause that contains both x and -x, and repeated literals"""
     cleaned_clauses = []
     for clause in clauses:
-        literals = set(clause)
+        literals = dict.fromkeys(clause)
         if any(-lit in literals for lit in literals):
             continue
         cleaned_clauses.append(list(literals))
     return cleaned_clauses
 
-def choose_variable(clauses):
-    # NO HEURISTIC, just pick the first literal of the first clause
-    return abs(clauses[0][0])
+
+def pure_literals(clauses, values):
+    "Unassigned literals whose negation is in no clause that is not satisfied yet."
+    occurring = set()
+    for clause in clauses:
+        if not any(values[lit] is True for lit in clause):
+            occurring.update(lit for lit in clause if values[lit] is None)
+    return [lit for lit in occurring if -lit not in occurring]
 
 
-def dpll(clauses: Iterable[Iterable[int]], assignment: dict) -> Tuple[str, List[int] | None]:
+def propagate(clauses, watches, values, trail, qhead) -> Tuple[int, bool]:
     """
-    DPLL SAT Solver implementation.
+    Unit propagation of the literals trail[qhead:], with two watched literals:
+    the first two literals of every clause are watched, and a clause is only
+    looked at when one of them becomes false. The watches stay valid when
+    the trail is undone, so backtracking does not touch them.
+    Returns the new qhead, and True if a clause became false.
+    """
+    while qhead < len(trail):
+        false_lit = -trail[qhead]
+        qhead += 1
+        watching = watches[false_lit]
+        i = 0
+        while i < len(watching):
+            clause = clauses[watching[i]]
+            # Keep the false literal second
+            if clause[0] == false_lit:
+                clause[0], clause[1] = clause[1], false_lit
+            if values[clause[0]] is True:
+                i += 1
+                continue
+
+            # Look for another literal to watch
+            for k in range(2, len(clause)):
+                if values[clause[k]] is not False:
+                    clause[1], clause[k] = clause[k], false_lit
+                    watches[clause[1]].append(watching[i])
+                    watching[i] = watching[-1]
+                    watching.pop()
+                    break
+            else:
+                # All other literals are false: unit, or a conflict
+                if values[clause[0]] is False:
+                    return qhead, True
+                assign(values, trail, clause[0])
+                i += 1
+    return qhead, False
+
+
+def dpll(clauses: List[List[int]], num_vars: int) -> List[bool | None] | None:
+    """
+    DPLL SAT Solver implementation, without recursion.
     Parameters:
-      clauses: Iterable of clauses, each clause is an iterable of integers (literals).
-      assignment: Current variable assignment as a dictionary {var: bool}.
+      clauses: list of clauses without tautologies or repeated literals. The
+               literals of a clause are reordered in place.
+      num_vars: number of variables.
     Returns:
-      True if satisfiable with the current assignment, False otherwise.
-    """
-    clauses = simplify(clauses, assignment) # Simplify clauses based on current assignment
-
-    # -- Remove any tautological clauses --
-    clauses = remove_tautologies(clauses)
-
-    # -- Base cases --
-    if not clauses:
-        return True # All clauses satisfied
-    if any(not clause for clause in clauses):
-        return False # Found an empty clause, unsatisfiable
-
-    # -- Implement unit propagation -- 
-    unit = find_unit_clause(clauses)
-    if unit is not None:
-        var = abs(unit)
-        value = unit > 0
-        assignment[var] = value
-        return dpll(clauses, assignment)
-    
-    # -- Pure literal elimination --
-    pure = find_pure_literal(clauses)
-    if pure is not None:
-        var=abs(pure)
-        value = pure > 0
-        assignment[var] = value 
-        return dpll(clauses, assignment)
-    
-    # -- Branching and Back tracking --
-    ## FOR NOW, we use a simple heuristic to choose the next variable to assign.
-    var = choose_variable(clauses) ## HEURISTIC CAN BE MODIFIED HERE
-
-    for val in [True, False]:
-        
-        new_assignment = assignment.copy()
-        new_assignment[abs(var)] = val
-
-        if dpll(clauses, new_assignment):
-            assignment.update(new_assignment)
-            return True
-    return False
-
-
-
-
-    
-
+      values (see above) if satisfiable, None otherwise.
 
+    The assignment is kept on a trail of literals, and the decisions on a
+    stack of (trail position, literal, flipped, clause index). A conflict
+    undoes the trail back to the last decision not tried both ways yet and
+    flips it, so nothing is copied, and the depth of the search is not
+    limited by the recursion limit.
+    """
+    values: List[bool | None] = [None] * (2 * num_vars + 1)
+    trail: List[int] = []
+    watches: Dict[int, List[int]] = {}
+    for v in range(1, num_vars + 1):
+        watches[v] = []
+        watches[-v] = []
+
+    # -- Empty and unit clauses are decided right away --
+    for index, clause in enumerate(clauses):
+        if not clause:
+            return None
+        if len(clause) == 1:
+            if values[clause[0]] is False:
+                return None
+            if values[clause[0]] is None:
+                assign(values, trail, clause[0])
+        else:
+            watches[clause[0]].append(index)
+            watches[clause[1]].append(index)
+
+    qhead, conflict = propagate(clauses, watches, values, trail, 0)
+    if conflict:
+        return None
+
+    # -- Pure literal elimination, once at the root --
+    for lit in pure_literals(clauses, values):
+        assign(values, trail, lit)
+
+    decisions: List[Tuple[int, int, bool, int]] = []
+    while True:
+        # -- Unit propagation --
+        qhead, conflict = propagate(clauses, watches, values, trail, qhead)
+
+        if conflict:
+            # -- Back tracking: flip the last decision tried one way only --
+            while decisions and decisions[-1][2]:
+                decisions.pop()
+            if not decisions:
+                return None
+            pos, lit, _, index = decisions.pop()
+            undo(values, trail, pos)
+            qhead = pos
+            decisions.append((pos, -lit, True, index))
+            assign(values, trail, -lit)
+            continue
 
-    # Choose a variable to assign (simple heuristic: first literal of the first clause)
-    ######## YOUR HEURISTIC HERE ########
+        # -- Branching --
+        # Simple heuristic: the first unassigned variable of the first clause
+        # not satisfied yet, True first. The clauses before the one of the
+        # last decision are still satisfied, so the search starts there.
+        index = decisions[-1][3] if decisions else 0
+        while index < len(clauses) and any(values[lit] is True for lit in clauses[index]):
+            index += 1
+        if index == len(clauses):
+            return values  # All clauses satisfied
 
+        # Propagation is complete, so the clause has two unassigned literals
+        var = abs(next(lit for lit in clauses[index] if values[lit] is None))
+        decisions.append((len(trail), var, False, index))
+        assign(values, trail, var)
 
 
 def solve_cnf(clauses: Iterable[Iterable[int]], num_vars: int) -> Tuple[str, List[int] | None]:
@@ -125,15 +172,9 @@ def solve_cnf(clauses: Iterable[Iterable[int]], num_vars: int) -> Tuple[str, Lis
       ("UNSAT", None)
     """
 
-    assignment = {}
-    result = dpll(clauses, assignment)
-    if result:
-        model = [v if assignment.get(v, False) else -v for v in range(1, num_vars + 1)] # unreasonable line\
+    values = dpll(remove_tautologies(clauses), num_vars)
+    if values is not None:
+        model = [v if values[v] is True else -v for v in range(1, num_vars + 1)]
         return ("SAT", model)
     else:
-        return ("UNSAT"), None
-    
-
-
-
-    
+        return ("UNSAT", None)
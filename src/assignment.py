@@ -1,96 +1,186 @@
-from lib import Variable, Var, Assn
-from heuristics import choose_splitting_var
+from collections.abc import Mapping
+from array import array
+from lib import Variable, Var, Clause, Assn, ASSN_OF_VALUE, FALSE, TRUE, UNKNOWN
+from heuristics import choose_splitting_var, VARIABLE_ORDERS
 import logging
 
+
+class AssignmentMap(Mapping):
+    '''
+    Read-only map of Variable to Assn over the value array of an Assignment,
+    handed to the heuristics
+    '''
+
+    def __init__(self, assignment):
+        self.assignment = assignment
+
+    def __getitem__(self, variable):
+        return ASSN_OF_VALUE[self.assignment.value[2 * variable.idx]]
+
+    def __iter__(self):
+        return iter(self.assignment.sat.variables.values())
+
+    def __len__(self):
+        return self.assignment.sat.num_vars
+
+
 class Assignment():
     '''
     Handles assignment info of variables
     '''
 
-    def __init__(self, variables, sat):
+    def __init__(self, variables, sat, order='static'):
         '''
-        assignment_stack: stack of our assignments comprising
-                          (assignment, variable) pairs, allowing backtracking easily.
-                          Head of stack contains our current assignment.
-        propagation_queue: Queue of variables that have been set to false
+        value:             value[lit] is the current value (FALSE, TRUE or UNKNOWN)
+                           of every literal of the integer core, updated in place
+        values:            the same information as a map of Variable to Assn
+        trail:             literals made true, in the order in which they were assigned
+        trail_lim:         trail_lim[i] is the index in trail where decision
+                           level i+1 starts
+        decisions:         decisions[i] is the literal that created decision
+                           level i+1
+        qhead:             trail[qhead:] has not been propagated yet
+        checker:           optional InvariantChecker that is told about every
+                           assignment and every clause visited by propagation
+        unassigned_count:  number of variables that are currently UNKNOWN
+        order:             variable order used by the default decision, by name
+                           (see VARIABLE_ORDERS in heuristics.py). 'static' picks
+                           variables in order of first appearance.
+        conflict:          index of the clause that caused the last conflict
+        propagations:      number of false literals processed by unit propagation
+        level:             level[v] is the decision level on which the variable
+                           with index v was assigned
+        reason:            reason[v] is the index of the clause that forced the
+                           variable with index v, or -1 for decisions and for
+                           assignments without a clause
+        seen:              scratch marks of conflict analysis, all 0 in between
         '''
         self.sat = sat # For heuristics
-        assignments = {}
-        for var_ in variables.values():
-            assignments[var_] = Assn.UNKNOWN
+        num_vars = len(variables)
+        self.value = bytearray([UNKNOWN]) * (2 * num_vars)
+        self.values = AssignmentMap(self)
+
+        self.unassigned_count = num_vars
+        self.order = VARIABLE_ORDERS[order](num_vars)
+        self.conflict = None
+        self.propagations = 0
 
-        self.assignment_stack = [
-            (assignments, None)
-        ]
+        self.level = array('i', [0]) * num_vars
+        self.reason = array('i', [-1]) * num_vars
+        self.seen = bytearray(num_vars)
 
-        self.propagation_queue = []
+        self.trail = array('i')
+        self.trail_lim = array('i')
+        self.decisions = array('i')
+        self.qhead = 0
+
+        self.checker = None
 
     def __repr__(self):
         s = "===SAT Assignments===\n"
-        for variable, assn in self.assignment_stack[-1][0].items():
+        for variable, assn in self.values.items():
             s += repr(variable) + ": " + Assn.toStr(assn) + "\n"
         return s
 
+    def decision_level(self):
+        '''
+        Returns the current decision level, 0 if no decision has been made
+        '''
+        return len(self.trail_lim)
+
+    def decision_variable(self):
+        '''
+        Returns the variable that created the current decision level
+        '''
+        return self.sat.var_of_lit(self.decisions[-1]).var
+
     def create_decision_level(self, variable: Variable, assn: Assn):
         '''
         Called when we are making a choice on an assignment that is not forced on us
-        This creates a new assignment level off the old one
+        This opens a new decision level, starting at the current end of the trail
         '''
         assert assn != Assn.UNKNOWN, "Cannot assign unknown"
-        assert self.assignment_stack[-1][0][variable] == Assn.UNKNOWN, "Cannot assign to assigned variable"
+        lit = self.lit_of(variable, assn)
+        assert self.value[lit] == UNKNOWN, "Cannot assign to assigned variable"
 
-        new_assignment = self.assignment_stack[-1][0].copy()
-        new_assignment[variable] = assn
-        self.assignment_stack.append((new_assignment, variable))
-
-        # Update propagation queue
-        if assn == Assn.TRUE:
-            self.propagation_queue.append(variable.getNeg())
-            logging.debug(f"Adding {variable.getNeg()} to propagation queue")
-        else:
-            self.propagation_queue.append(variable.getPos())
-            logging.debug(f"Adding {variable.getPos()} to propagation queue")
+        self.trail_lim.append(len(self.trail))
+        self.decisions.append(lit)
+        logging.debug(f"Assigning {variable} to {Assn.toStr(assn)}")
+        self.assign_lit(lit)
 
     def backtrack(self):
         '''
-        Backtracks and restores assignment from previous level.
+        Backtracks to the previous level, unassigning only the variables
+        assigned since this level was created.
         We also return the variable that was used for the assignment at this level.
         '''
-        assert len(self.assignment_stack) > 1, "Cannot backtrack from base layer"
-        (_, var_) = self.assignment_stack.pop()
-        return var_
+        assert len(self.trail_lim) > 0, "Cannot backtrack from base layer"
+        variable = self.decision_variable()
+        self.backjump(self.decision_level() - 1)
+        return variable
+
+    def backjump(self, level: int):
+        '''
+        Backtracks to decision level level, unassigning every variable
+        assigned on a higher level at once
+        '''
+        assert 0 <= level <= self.decision_level(), "Cannot backjump to a higher level"
+        if level == self.decision_level():
+            return
+        cut = self.trail_lim[level]
+        del self.trail_lim[level:]
+        del self.decisions[level:]
 
-    def assign(self, variable: Variable, assn: Assn):
+        value = self.value
+        order = self.order
+        for lit in self.trail[cut:]:
+            value[lit] = UNKNOWN
+            value[lit ^ 1] = UNKNOWN
+            order.insert(lit >> 1)
+        self.unassigned_count += len(self.trail) - cut
+        del self.trail[cut:]
+
+        # Everything not yet propagated was assigned on the levels we just undid
+        self.qhead = cut
+
+    @staticmethod
+    def lit_of(variable: Variable, assn: Assn):
+        '''
+        Returns the literal that is true when variable has value assn
+        '''
+        return 2 * variable.idx + (assn == Assn.FALSE)
+
+    def assign(self, variable: Variable, assn: Assn, reason: Clause = None):
         '''
         Performs an assignment that is forced on us, applied on the current
-        decision level
+        decision level. reason is the clause that forces it, if there is one.
         '''
         assert assn != Assn.UNKNOWN, "Cannot assign unknown"
-        assert variable in self.assignment_stack[-1][0], "Use variable not var!"
-        self.assignment_stack[-1][0][variable] = assn
-
+        assert isinstance(variable, Variable), "Use variable not var!"
         logging.debug(f"Assigning {variable} to {Assn.toStr(assn)}")
+        self.assign_lit(self.lit_of(variable, assn), -1 if reason is None else reason.idx)
 
-        # Update propagation queue
-        if assn == Assn.TRUE:
-            logging.debug(f"Adding {variable.getNeg()} to propagation queue")
-            self.propagation_queue.append(variable.getNeg())
-        else:
-            logging.debug(f"Adding {variable.getPos()} to propagation queue")
-            self.propagation_queue.append(variable.getPos())
-
-        logging.debug(f"Propagation queue: {self.propagation_queue}")
+    def assign_lit(self, lit: int, reason: int = -1):
+        '''
+        Makes literal lit true on the current decision level, and queues
+        its negation (which just became false) for propagation.
+        reason is the index of the clause that forces lit, or -1.
+        '''
+        assert self.value[lit] == UNKNOWN, "Cannot assign to assigned variable"
+        self.value[lit] = TRUE
+        self.value[lit ^ 1] = FALSE
+        self.level[lit >> 1] = len(self.trail_lim)
+        self.reason[lit >> 1] = reason
+        self.trail.append(lit)
+        self.unassigned_count -= 1
+        if self.checker is not None:
+            self.checker.assigned(lit >> 1)
 
     def num_unassigned(self):
         '''
         Returns number of unassigned variables at the current level
         '''
-        num_unassigned = 0
-        for assn in self.assignment_stack[-1][0].values():
-            if assn == Assn.UNKNOWN:
-                num_unassigned += 1
-
-        return num_unassigned
+        return self.unassigned_count
 
     def get_unassigned_var(self):
         '''
@@ -98,60 +188,181 @@ class Assignment():
         Future extension: add better heuristics, allow users to specify their own
         '''
         try:
-            var_ = choose_splitting_var(self.assignment_stack[-1][0], self.sat)
+            var_ = choose_splitting_var(self.values, self.sat)
             assert self.get_assignment_val(var_.getPos()) == Assn.UNKNOWN, \
                 "choose_splitting_var must return an unassigned var"
             return var_
         except NotImplementedError:
-            # Default: find the first unassigned var
-            for var_, assn in self.assignment_stack[-1][0].items():
-                if assn == Assn.UNKNOWN:
-                    return var_
-                
+            # Default: the next unassigned var of the variable order
+            value = self.value
+            var_idx = self.order.pick(lambda v: value[2 * v] == UNKNOWN)
+            if var_idx is not None:
+                return self.sat.var_of_lit(2 * var_idx).var
+
+    def bump_conflict(self):
+        '''
+        Bumps the activity of the variables in the last conflict clause,
+        used by activity-based variable orders
+        '''
+        order = self.order
+        for lit in self.sat.clause_lits(self.conflict):
+            order.bump(lit >> 1)
+        order.decay()
+
+    def analyze(self):
+        '''
+        1-UIP conflict analysis of the last conflict.
+
+        Resolves the conflict clause with the reasons of its literals from
+        the current decision level, latest first, until a single literal of
+        that level is left: the first unique implication point. Variables at
+        level 0 are always false and are dropped. Every variable that takes
+        part is bumped in the variable order.
+
+        Returns the learned clause as literals of the integer core, with the
+        negation of the UIP first (it becomes true after backjumping) and a
+        literal of the highest remaining level second, together with that
+        level, which is the level to backjump to.
+        '''
+        lits = self.sat.lits
+        starts = self.sat.starts
+        trail = self.trail
+        level = self.level
+        reason = self.reason
+        seen = self.seen
+        order = self.order
+        current = self.decision_level()
+
+        learnt = [-1]  # Placeholder for the negation of the UIP
+        pending = 0    # Literals of the current level still to be resolved
+        clause_idx = self.conflict
+        uip = -1
+        idx = len(trail) - 1
+        while True:
+            for k in range(starts[clause_idx], starts[clause_idx + 1]):
+                lit = lits[k]
+                v = lit >> 1
+                if lit == uip or seen[v] or level[v] == 0:
+                    continue
+                seen[v] = 1
+                order.bump(v)
+                if level[v] == current:
+                    pending += 1
+                else:
+                    learnt.append(lit)
+
+            # Latest assigned literal of the current level in the resolvent
+            while not seen[trail[idx] >> 1]:
+                idx -= 1
+            uip = trail[idx]
+            idx -= 1
+            seen[uip >> 1] = 0
+            pending -= 1
+            if pending == 0:
+                break
+            clause_idx = reason[uip >> 1]
+        learnt[0] = uip ^ 1
+
+        for lit in learnt:
+            seen[lit >> 1] = 0
+
+        backjump_level = 0
+        if len(learnt) > 1:
+            top = max(range(1, len(learnt)), key=lambda i: level[learnt[i] >> 1])
+            learnt[1], learnt[top] = learnt[top], learnt[1]
+            backjump_level = level[learnt[1] >> 1]
+        return learnt, backjump_level
+
+    def learn(self, learnt):
+        '''
+        Adds a clause returned by analyze to the formula after backjumping,
+        and asserts its first literal, which is the only one left unassigned
+        '''
+        if len(learnt) == 1:
+            # Units are level 0 facts, they need no clause
+            self.assign_lit(learnt[0])
+            return
+
+        clause_idx = self.sat.add_learnt(learnt)
+        if self.checker is not None:
+            self.checker.touch(clause_idx)
+        self.assign_lit(learnt[0], clause_idx)
 
     def get_assignment_val(self, var_: Var):
         '''
-        Gets assignment value of a variable 
+        Gets assignment value of a variable
         If it is NOT x, then answer is negated
         '''
-        var_base_val = self.assignment_stack[-1][0][var_.var]
-        if var_.isNeg():
-            return Assn.neg(var_base_val)
-        return var_base_val
+        return ASSN_OF_VALUE[self.value[var_.lit]]
 
     def unit_propagation(self):
         '''
         Performs unit propagation on the current assignment
 
+        For every literal that became false, visit the clauses watching it.
+        The watched literals are the first two of a clause: the false one is
+        moved to the second position, and replaced by another literal that is
+        not false if there is one. If there is none, the clause is either
+        satisfied by its first literal, unit (so the first literal is forced),
+        or conflicting.
+
         Returns negative number if backtracking is necessary,
         else 0 on success
         '''
-        while len(self.propagation_queue) > 0:
-            var_ = self.propagation_queue.pop()
-            logging.debug("Processing propagation queue: " + repr(var_))
-            logging.debug(var_.watchingClauses())
+        value = self.value
+        trail = self.trail
+        lits = self.sat.lits
+        starts = self.sat.starts
+        watches = self.sat.watches
+        checker = self.checker
+
+        while self.qhead < len(trail):
+            false_lit = trail[self.qhead] ^ 1
+            self.qhead += 1
+            self.propagations += 1
+
+            ws = watches[false_lit]
+            n = len(ws)
+            i = j = 0
+            while i < n:
+                clause_idx = ws[i]
+                i += 1
+                if checker is not None:
+                    checker.touch(clause_idx)
+
+                start = starts[clause_idx]
+                if lits[start] == false_lit:
+                    lits[start] = lits[start + 1]
+                    lits[start + 1] = false_lit
 
-            # Make a copy, as we are modifying this on the fly
-            clauses = var_.watchingClauses().copy()
-            for clause in clauses:
                 # If the clause is watching some other
                 # literal that is true, then we are fine
-                logging.debug("Dealing with clause: " + clause.pp(self))
-                if self.get_assignment_val(var_) != Assn.FALSE:
-                    logging.debug(
-                        "Current assignment no longer cause conflict")
-                    continue
-
-                if clause.is_watching_true(self):
-                    logging.debug("Clause already satisfied")
+                first = lits[start]
+                if value[first] == TRUE:
+                    ws[j] = clause_idx
+                    j += 1
                     continue
 
                 # If not, we need to make the clause watch something else that is not False
-                if clause.resolve_watch(var_, self) < 0:
-                    logging.debug(
-                        "Could not watch anything else, need to backtrack!")
-                    return -1  # need to backtrack
-                logging.debug("New watchlist: " + clause.pp(self))
-                assert clause.is_not_just_watching_false(
-                    self), "Should not be just watching false :" + clause.pp(self)
-        return 0
\ No newline at end of file
+                for k in range(start + 2, starts[clause_idx + 1]):
+                    lit = lits[k]
+                    if value[lit] != FALSE:
+                        lits[start + 1] = lit
+                        lits[k] = false_lit
+                        watches[lit].append(clause_idx)
+                        break
+                else:
+                    ws[j] = clause_idx
+                    j += 1
+                    if value[first] == FALSE:
+                        # Could not watch anything else, need to backtrack!
+                        del ws[j:i]
+                        self.qhead = len(trail)
+                        self.conflict = clause_idx
+                        return -1
+
+                    # Else we force the other watched literal to be true
+                    self.assign_lit(first, clause_idx)
+
+            del ws[j:]
+        return 0
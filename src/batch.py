@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+'''
+Batch runner: solves many instances on a pool of worker processes.
+
+Instances are given as directories and/or glob patterns, and archives of
+bincnf.py stand for all the instances packed in them. Every result is
+written as one JSON line as soon as it is available:
+
+    {"instance": ..., "answer": "SAT" | "UNSAT" | "TIMEOUT" | "ERROR",
+     "expected": "SAT" | "UNSAT" | null, "time": seconds, "stats": {...}}
+
+The expected answer comes from a manifest CSV if one is given (columns
+status plus instance, or puzzle_id for the Sudoku puzzles), else from a
+directory called sat or unsat in the path of the instance.
+
+When the results file already exists, the instances recorded in it are
+skipped and new results are appended, so an interrupted run can be resumed
+by running the same command again.
+
+Engines:
+    dpll:     the DPLL solver of src/ (sat.py), for CNF files
+    src-cdcl: the same solver in CDCL mode, for CNF files
+    cdcl:     the CDCLSolver of the Sudoku project (ameebaby.py), for CNF files
+              and for Sudoku puzzles (.txt), which are encoded with encoder.to_cnf
+    cdcl-inc: the same solver, incremental, for Sudoku puzzles only. Every
+              worker loads the rules of a grid size (encoder_cache.py) once,
+              and solves each puzzle under its clues as assumptions, keeping
+              the learned clauses. The stats are totals of the worker's solver
+              so far, and the clues that contradict each other are listed
+              under "failed" for UNSAT puzzles.
+'''
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bincnf import ARCHIVE_SUFFIX, archive_members, read_cnf, split_member
+
+SUDOKU_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                          "SAT Project - Assignment 2 - Files")
+
+ENGINES = ("dpll", "src-cdcl", "cdcl", "cdcl-inc")
+
+# Solvers of the cdcl-inc engine by (grid size, order), kept by every worker
+# process for all the puzzles it solves
+INCREMENTAL_SOLVERS = {}
+
+
+class Timeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise Timeout()
+
+
+def collect_instances(patterns):
+    '''
+    Expands directories and glob patterns into a sorted list of instance
+    files, and archives into their instances
+    '''
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for name in os.listdir(pattern):
+                path = os.path.join(pattern, name)
+                if os.path.isfile(path) and not name.endswith(".csv"):
+                    files.append(path)
+        else:
+            files.extend(glob.glob(pattern))
+
+    instances = []
+    for location in files:
+        if location.endswith(ARCHIVE_SUFFIX):
+            instances.extend(archive_members(location))
+        else:
+            instances.append(location)
+    return sorted(set(instances))
+
+
+def load_manifest(location):
+    '''
+    Reads a manifest CSV into a map of instance file name to expected answer
+    '''
+    expected = {}
+    with open(location, newline='') as f:
+        for row in csv.DictReader(f):
+            if "instance" in row:
+                name = os.path.basename(row["instance"])
+            else:
+                name = f"puzzle{row['puzzle_id']}.txt"
+            expected[name] = row["status"].strip().upper()
+    return expected
+
+
+def expected_answer(location, manifest):
+    archive, name = split_member(location)
+    if name is not None:
+        location = name
+    if manifest is not None:
+        return manifest.get(os.path.basename(location))
+
+    parts = os.path.normpath(location).split(os.sep)
+    if "unsat" in parts:
+        return "UNSAT"
+    if "sat" in parts:
+        return "SAT"
+    return None
+
+
+def solve_dpll(location, order, mode="dpll"):
+    from lib import UnsatException
+    from loader import Loader
+    from sat import SATSolver
+
+    try:
+        sat = Loader.load_file(location)
+    except UnsatException:
+        # Empty clause
+        return "UNSAT", None
+    solver = SATSolver(sat, order=order, mode=mode)
+    answer = "SAT" if solver.solve() else "UNSAT"
+    return answer, solver.stats()
+
+
+def solve_cdcl(location, order):
+    if SUDOKU_DIR not in sys.path:
+        sys.path.append(SUDOKU_DIR)
+    from ameebaby import CDCLSolver
+
+    if location.endswith(".txt"):
+        from encoder import to_cnf
+        clauses, num_vars = to_cnf(location)
+    else:
+        cnf = read_cnf(location)
+        clauses, num_vars = cnf.clauses(), cnf.num_vars
+
+    solver = CDCLSolver(clauses, num_vars, order)
+    answer = "SAT" if solver.solve() else "UNSAT"
+    return answer, solver.stats()
+
+
+def solve_incremental(location, order):
+    if SUDOKU_DIR not in sys.path:
+        sys.path.append(SUDOKU_DIR)
+    from ameebaby import CDCLSolver
+    from encoder import clue_literals, read_puzzle
+    from encoder_cache import cached_base_cnf
+
+    grid, N = read_puzzle(location)
+    key = (N, order)
+    solver = INCREMENTAL_SOLVERS.get(key)
+    if solver is None:
+        clauses, num_vars = cached_base_cnf(N)
+        solver = INCREMENTAL_SOLVERS[key] = CDCLSolver(clauses, num_vars, order)
+
+    try:
+        sat = solver.solve(clue_literals(grid, N))
+    except BaseException:
+        # Interrupted in the middle of the search, by a timeout: the next
+        # puzzle of this size starts over with a new solver
+        del INCREMENTAL_SOLVERS[key]
+        raise
+
+    stats = solver.stats()
+    if not sat:
+        stats["failed"] = solver.failed
+    return "SAT" if sat else "UNSAT", stats
+
+
+def run_instance(location, engine, order, timeout):
+    '''
+    Solves one instance in a worker process, and returns its result line
+    '''
+    signal.signal(signal.SIGALRM, raise_timeout)
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    stats = None
+    start = time.perf_counter()
+    try:
+        if engine == "dpll":
+            answer, stats = solve_dpll(location, order)
+        elif engine == "src-cdcl":
+            answer, stats = solve_dpll(location, order, "cdcl")
+        elif engine == "cdcl-inc":
+            answer, stats = solve_incremental(location, order)
+        else:
+            answer, stats = solve_cdcl(location, order)
+    except Timeout:
+        answer = "TIMEOUT"
+    except Exception as e:
+        logging.exception(f"Failed on {location}")
+        answer = "ERROR"
+        stats = {"error": repr(e)}
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "instance": location,
+        "answer": answer,
+        "time": round(elapsed, 6),
+        "stats": stats,
+    }
+
+
+def load_done(location):
+    '''
+    Returns the instances already recorded in a results file
+    '''
+    done = set()
+    if not os.path.exists(location):
+        return done
+    with open(location) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                done.add(json.loads(line)["instance"])
+            except (ValueError, KeyError):
+                # Last line of an interrupted run may be cut off
+                logging.warning(f"Skipping malformed result line: {line}")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbosity", help="increase output verbosity", action="count")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="time limit per instance in seconds")
+    parser.add_argument("-e", "--engine", choices=ENGINES, default="dpll",
+                        help="solver used for every instance")
+    parser.add_argument("-o", "--order", default=None,
+                        help="variable order, see VARIABLE_ORDERS in heuristics.py")
+    parser.add_argument("-m", "--manifest", default=None,
+                        help="CSV with the expected status of every instance")
+    parser.add_argument("-r", "--results", default=None,
+                        help="JSONL results file, appended to and used to resume")
+    parser.add_argument('instances', metavar='i', type=str, nargs='+',
+                        help='directories or glob patterns of instances to solve')
+    args = parser.parse_args()
+    if args.verbosity == 2:
+        logging.basicConfig(level=logging.DEBUG)
+    elif args.verbosity == 1:
+        logging.basicConfig(level=logging.INFO)
+    else:
+        logging.basicConfig(level=logging.WARN)
+
+    order = args.order
+    if order is None:
+        order = "static" if args.engine == "dpll" else "vsids"
+
+    manifest = load_manifest(args.manifest) if args.manifest else None
+    instances = collect_instances(args.instances)
+
+    out = sys.stdout
+    if args.results is not None:
+        done = load_done(args.results)
+        if done:
+            logging.info(f"Resuming, {len(done)} instances already done")
+        instances = [location for location in instances if location not in done]
+        out = open(args.results, "a")
+
+    wrong = 0
+    try:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(run_instance, location, args.engine, order, args.timeout)
+                       for location in instances]
+            for future in as_completed(futures):
+                result = future.result()
+                result["expected"] = expected_answer(result["instance"], manifest)
+                if result["expected"] is not None and result["answer"] in ("SAT", "UNSAT") \
+                        and result["answer"] != result["expected"]:
+                    wrong += 1
+                    logging.error(f"Wrong answer for {result['instance']}: {result['answer']}")
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if wrong > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
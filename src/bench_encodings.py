@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+'''
+Benchmark of the at-most-one encodings of the Sudoku encoder.
+
+Every puzzle of the selected sizes is encoded once with each encoding of
+encoder.AMO_ENCODINGS and solved with solve_cnf of ameebaby.py. With
+--reduced, the puzzles use the clue-aware reduced encoding. For every
+size and encoding, one line reports:
+
+    n:        number of puzzles
+    wrong:    answers that differ from the manifest
+    t/o:      solves that hit --timeout
+    encode s: median time of encoder.to_cnf
+    vars:     median number of variables, auxiliary ones included
+    clauses:  median number of clauses
+    lits:     median number of literals
+    solve s:  median time of solve_cnf (preprocessing included with
+              --preprocess), timed out solves count as --timeout
+'''
+import argparse
+import csv
+import json
+import logging
+import os
+import signal
+import statistics
+import sys
+import time
+
+from batch import SUDOKU_DIR, Timeout, raise_timeout, load_manifest
+from benchmark import PUZZLE_DIR, MANIFEST
+
+
+def puzzles_of_size(size, limit):
+    '''
+    Returns the puzzle files of the manifest with N = size, at most limit
+    of them if limit > 0
+    '''
+    puzzles = []
+    with open(MANIFEST, newline='') as f:
+        for row in csv.DictReader(f):
+            if int(row["n"]) == size:
+                puzzles.append(os.path.join(PUZZLE_DIR, f"puzzle{row['puzzle_id']}.txt"))
+    puzzles.sort(key=lambda location: int(os.path.basename(location)[6:-4]))
+    if limit > 0:
+        puzzles = puzzles[:limit]
+    return puzzles
+
+
+def bench_puzzle(location, amo, reduced, timeout, preprocess):
+    from encoder import to_cnf
+    from ameebaby import solve_cnf
+
+    start = time.perf_counter()
+    clauses, num_vars = to_cnf(location, amo, reduced)
+    encode_time = time.perf_counter() - start
+
+    signal.signal(signal.SIGALRM, raise_timeout)
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.perf_counter()
+    try:
+        answer, _ = solve_cnf(clauses, num_vars, preprocess=preprocess)
+    except Timeout:
+        answer = "TIMEOUT"
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    solve_time = time.perf_counter() - start
+
+    return {
+        "instance": os.path.basename(location),
+        "encoding": amo,
+        "answer": answer,
+        "encode_time": round(encode_time, 6),
+        "vars": num_vars,
+        "clauses": len(clauses),
+        "lits": sum(len(clause) for clause in clauses),
+        "solve_time": round(solve_time, 6),
+    }
+
+
+def report(results):
+    print(f"{'N':>3} {'encoding':10} {'n':>3} {'wrong':>5} {'t/o':>4} {'encode s':>9} "
+          f"{'vars':>7} {'clauses':>8} {'lits':>8} {'solve s':>9}")
+    groups = {}
+    for entry in results:
+        groups.setdefault((entry["size"], entry["encoding"]), []).append(entry)
+    for (size, amo), entries in groups.items():
+        wrong = sum(1 for e in entries if e["answer"] not in ("TIMEOUT", e["expected"]))
+        timeouts = sum(1 for e in entries if e["answer"] == "TIMEOUT")
+
+        def median(key):
+            return statistics.median(e[key] for e in entries)
+        print(f"{size:>3} {amo:10} {len(entries):>3} {wrong:>5} {timeouts:>4} "
+              f"{median('encode_time'):>9.4f} {median('vars'):>7.0f} {median('clauses'):>8.0f} "
+              f"{median('lits'):>8.0f} {median('solve_time'):>9.3f}")
+
+
+def main():
+    if SUDOKU_DIR not in sys.path:
+        sys.path.append(SUDOKU_DIR)
+    from encoder import AMO_ENCODINGS
+    import encoder_cache
+
+    # Time the encodings themselves, not the cache of the base CNF
+    encoder_cache.BASE_CACHE = encoder_cache.BaseCNFCache(directory=None, capacity=0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbosity", help="increase output verbosity", action="count")
+    parser.add_argument("-a", "--encodings", nargs="+", choices=list(AMO_ENCODINGS),
+                        default=list(AMO_ENCODINGS), help="at-most-one encodings to compare")
+    parser.add_argument("-N", "--sizes", nargs="+", type=int, default=[9, 16, 25],
+                        help="puzzle sizes")
+    parser.add_argument("-n", "--limit", type=int, default=3,
+                        help="puzzles per size (the first ones of the manifest), 0 for all")
+    parser.add_argument("-t", "--timeout", type=float, default=60,
+                        help="time limit per solve in seconds")
+    parser.add_argument("-R", "--reduced", action="store_true",
+                        help="encode only the candidates left after propagating the clues")
+    parser.add_argument("-p", "--preprocess", action="store_true",
+                        help="simplify the encodings before solving")
+    parser.add_argument("-o", "--output", default=None, help="write the full results as JSON")
+    args = parser.parse_args()
+    if args.verbosity == 2:
+        logging.basicConfig(level=logging.DEBUG)
+    elif args.verbosity == 1:
+        logging.basicConfig(level=logging.INFO)
+    else:
+        logging.basicConfig(level=logging.WARN)
+
+    manifest = load_manifest(MANIFEST)
+    results = []
+    for size in args.sizes:
+        for location in puzzles_of_size(size, args.limit):
+            for amo in args.encodings:
+                logging.info(f"{amo} {location}")
+                entry = bench_puzzle(location, amo, args.reduced, args.timeout,
+                                     args.preprocess)
+                entry["size"] = size
+                entry["expected"] = manifest.get(entry["instance"])
+                results.append(entry)
+
+    report(results)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if any(e["answer"] not in ("TIMEOUT", e["expected"]) for e in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
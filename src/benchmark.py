@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+'''
+Reproducible benchmark of the solver engines.
+
+Suites:
+    uf50:    satisfiable SATLIB instances in dat/sat
+    uuf50:   unsatisfiable SATLIB instances in dat/unsat
+    small:   hand-crafted instances in small/
+    puzzles: every Sudoku puzzle of puzzles/!puzzles_manifest.csv
+
+Engines:
+    dpll:     SATSolver in src/sat.py
+    src-cdcl: SATSolver in src/sat.py, in CDCL mode
+    cdcl:     CDCLSolver in ameebaby.py
+    simple:   solve_cnf in solver.py
+    baby:     solve_cnf in baby.py
+
+Every instance is solved --repeat times in this process, one after another,
+and the median wall-clock time is reported together with the number of
+decisions, conflicts and propagations per second (for the engines that count
+them). Answers are checked against the expected status.
+
+A run can be saved as a baseline (--save-baseline). A later run compared with
+it (--baseline) flags an instance as a regression when its times are slower
+with a one-sided Mann-Whitney U test at level --alpha, and the median slowed
+down by more than --threshold. The baseline also records a hash of the source
+of each engine, so --changed-only benchmarks just the engines that changed.
+'''
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import signal
+import statistics
+import sys
+import time
+
+from batch import SUDOKU_DIR, Timeout, raise_timeout, collect_instances, load_manifest, expected_answer
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+PUZZLE_DIR = os.path.join(SUDOKU_DIR, "puzzles")
+MANIFEST = os.path.join(PUZZLE_DIR, "!puzzles_manifest.csv")
+
+SUITES = {
+    "uf50": [os.path.join(ROOT_DIR, "dat", "sat")],
+    "uuf50": [os.path.join(ROOT_DIR, "dat", "unsat")],
+    "small": [os.path.join(ROOT_DIR, "small")],
+    "puzzles": [os.path.join(PUZZLE_DIR, "*.txt")],
+}
+
+# Source files of every engine, used to detect changes against the baseline
+ENGINE_SOURCES = {
+    "dpll": [os.path.join(SRC_DIR, name) for name in ("sat.py", "assignment.py", "lib.py", "heuristics.py")],
+    "src-cdcl": [os.path.join(SRC_DIR, name) for name in ("sat.py", "assignment.py", "lib.py", "heuristics.py")],
+    # ameebaby.py with everything solve_cnf imports, the parallel modes included
+    "cdcl": [os.path.join(SUDOKU_DIR, name) for name in ("ameebaby.py", "portfolio.py", "cube.py")]
+            + [os.path.join(SRC_DIR, name)
+               for name in ("heuristics.py", "lib.py", "restarts.py", "preprocess.py")],
+    "simple": [os.path.join(SUDOKU_DIR, "solver.py")],
+    "baby": [os.path.join(SUDOKU_DIR, "baby.py")],
+}
+
+# The src engine needs every clause to have at least two literals, so it
+# cannot take the Sudoku encodings, which have unit clauses for the clues
+ENGINE_SUITES = {
+    "dpll": ("uf50", "uuf50", "small"),
+    "src-cdcl": ("uf50", "uuf50", "small"),
+}
+
+
+def engine_hash(engine):
+    digest = hashlib.sha256()
+    for location in ENGINE_SOURCES[engine]:
+        with open(location, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def small_expected(location):
+    name = os.path.basename(location)
+    if "unsat" in name:
+        return "UNSAT"
+    if "sat" in name:
+        return "SAT"
+    return None
+
+
+def load_instance(location):
+    '''
+    Returns (clauses, num_vars) of a CNF file or a Sudoku puzzle
+    '''
+    if location.endswith(".txt"):
+        from encoder import to_cnf
+        clauses, num_vars = to_cnf(location)
+        return [list(clause) for clause in clauses], num_vars
+
+    from bincnf import read_cnf
+    cnf = read_cnf(location)
+    return list(cnf.clauses()), cnf.num_vars
+
+
+def prepare_run(engine, clauses, num_vars):
+    '''
+    Returns a function that solves the instance once with engine, and returns
+    (answer, stats). Building the solver's data structures is not timed.
+    '''
+    if engine in ("dpll", "src-cdcl"):
+        from lib import SAT
+        from sat import SATSolver
+
+        if any(len(clause) == 0 for clause in clauses):
+            # SAT cannot hold an empty clause
+            def run():
+                return "UNSAT", None
+            return run
+        sat = SAT()
+        for clause in clauses:
+            sat.add_clause(clause)
+        if engine == "dpll":
+            solver = SATSolver(sat)
+        else:
+            solver = SATSolver(sat, order="vsids", mode="cdcl")
+
+        def run():
+            return ("SAT" if solver.solve() else "UNSAT"), solver.stats()
+        return run
+
+    if engine == "cdcl":
+        from ameebaby import CDCLSolver
+
+        solver = CDCLSolver(clauses, num_vars)
+
+        def run():
+            return ("SAT" if solver.solve() else "UNSAT"), solver.stats()
+        return run
+
+    module = __import__("solver" if engine == "simple" else "baby")
+    copy = [list(clause) for clause in clauses]
+
+    def run():
+        answer, _ = module.solve_cnf(copy, num_vars)
+        return answer, None
+    return run
+
+
+def bench_instance(engine, location, expected, repeat, timeout):
+    clauses, num_vars = load_instance(location)
+
+    times = []
+    answer = None
+    stats = None
+    for _ in range(repeat):
+        # Every repeat gets a fresh solver, so no run benefits from the previous one
+        run = prepare_run(engine, clauses, num_vars)
+        signal.signal(signal.SIGALRM, raise_timeout)
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        start = time.perf_counter()
+        try:
+            answer, stats = run()
+        except Timeout:
+            answer = "TIMEOUT"
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        times.append(time.perf_counter() - start)
+        if answer == "TIMEOUT":
+            break
+
+    median = statistics.median(times)
+    result = {
+        "instance": os.path.relpath(location, ROOT_DIR),
+        "answer": answer,
+        "expected": expected,
+        "times": [round(t, 6) for t in times],
+        "median": round(median, 6),
+        "stats": stats,
+    }
+    if stats is not None and median > 0:
+        result["propagations_per_sec"] = round(stats["propagations"] / median, 1)
+    return result
+
+
+def mann_whitney_greater(xs, ys):
+    '''
+    One-sided Mann-Whitney U test of "xs tend to be larger than ys".
+    Exact for small samples, normal approximation otherwise.
+    Returns the p-value.
+    '''
+    n1, n2 = len(xs), len(ys)
+    if n1 == 0 or n2 == 0:
+        return 1.0
+
+    def u_statistic(a, b):
+        return sum(1.0 if x > y else 0.5 if x == y else 0.0 for x in a for y in b)
+
+    u = u_statistic(xs, ys)
+    if n1 + n2 <= 12:
+        pooled = list(xs) + list(ys)
+        count = 0
+        total = 0
+        for chosen in itertools.combinations(range(n1 + n2), n1):
+            chosen_set = set(chosen)
+            a = [pooled[i] for i in chosen]
+            b = [pooled[i] for i in range(n1 + n2) if i not in chosen_set]
+            total += 1
+            if u_statistic(a, b) >= u:
+                count += 1
+        return count / total
+
+    mean = n1 * n2 / 2
+    sd = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    z = (u - mean - 0.5) / sd
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(results, baseline, alpha, threshold):
+    '''
+    Returns the regressions of results against the baseline run
+    '''
+    old = {}
+    for entry in baseline["results"]:
+        old[(entry["engine"], entry["instance"])] = entry
+
+    regressions = []
+    for entry in results:
+        before = old.get((entry["engine"], entry["instance"]))
+        if before is None or entry["answer"] not in ("SAT", "UNSAT"):
+            continue
+        slowdown = entry["median"] / before["median"] - 1 if before["median"] > 0 else 0.0
+        p_value = mann_whitney_greater(entry["times"], before["times"])
+        if p_value < alpha and slowdown > threshold:
+            regressions.append({
+                "engine": entry["engine"],
+                "instance": entry["instance"],
+                "baseline_median": before["median"],
+                "median": entry["median"],
+                "slowdown": round(slowdown, 4),
+                "p_value": round(p_value, 6),
+            })
+    return regressions
+
+
+def summarize(results):
+    '''
+    Prints one line per engine and suite
+    '''
+    groups = {}
+    for entry in results:
+        groups.setdefault((entry["engine"], entry["suite"]), []).append(entry)
+
+    print(f"{'engine':8} {'suite':8} {'n':>5} {'wrong':>5} {'t/o':>5} {'median s':>10} "
+          f"{'decisions':>10} {'conflicts':>10} {'props/s':>10}")
+    for (engine, suite), entries in sorted(groups.items()):
+        wrong = sum(1 for e in entries if e["expected"] is not None
+                    and e["answer"] in ("SAT", "UNSAT") and e["answer"] != e["expected"])
+        failed = sum(1 for e in entries if e["answer"] not in ("SAT", "UNSAT"))
+        median = statistics.median(e["median"] for e in entries)
+        with_stats = [e for e in entries if e["stats"] is not None]
+        if with_stats:
+            decisions = statistics.median(e["stats"]["decisions"] for e in with_stats)
+            conflicts = statistics.median(e["stats"]["conflicts"] for e in with_stats)
+            props = statistics.median(e.get("propagations_per_sec", 0) for e in with_stats)
+            counts = f"{decisions:>10.0f} {conflicts:>10.0f} {props:>10.0f}"
+        else:
+            counts = f"{'-':>10} {'-':>10} {'-':>10}"
+        print(f"{engine:8} {suite:8} {len(entries):>5} {wrong:>5} {failed:>5} {median:>10.4f} {counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbosity", help="increase output verbosity", action="count")
+    parser.add_argument("-e", "--engines", nargs="+", choices=list(ENGINE_SOURCES),
+                        default=list(ENGINE_SOURCES), help="engines to benchmark")
+    parser.add_argument("-s", "--suites", nargs="+", choices=list(SUITES),
+                        default=list(SUITES), help="suites to run")
+    parser.add_argument("-n", "--limit", type=int, default=50,
+                        help="instances per suite (the first ones in sorted order), 0 for all")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per instance")
+    parser.add_argument("-t", "--timeout", type=float, default=60,
+                        help="time limit per run in seconds")
+    parser.add_argument("-o", "--output", default=None, help="write the full results as JSON")
+    parser.add_argument("--save-baseline", default=None, help="store this run as a baseline")
+    parser.add_argument("--baseline", default=None, help="baseline to compare against")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="only benchmark engines whose source changed since the baseline")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="significance level of the regression test")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="minimum relative slowdown of the median to report")
+    args = parser.parse_args()
+    if args.verbosity == 2:
+        logging.basicConfig(level=logging.DEBUG)
+    elif args.verbosity == 1:
+        logging.basicConfig(level=logging.INFO)
+    else:
+        logging.basicConfig(level=logging.WARN)
+
+    if SUDOKU_DIR not in sys.path:
+        sys.path.append(SUDOKU_DIR)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    hashes = {engine: engine_hash(engine) for engine in ENGINE_SOURCES}
+    engines = args.engines
+    if args.changed_only and baseline is not None:
+        engines = [e for e in engines if baseline["engines"].get(e) != hashes[e]]
+        logging.info(f"Engines changed since the baseline: {engines}")
+
+    manifest = load_manifest(MANIFEST)
+    results = []
+    for suite in args.suites:
+        instances = collect_instances(SUITES[suite])
+        if args.limit > 0:
+            instances = instances[:args.limit]
+        for engine in engines:
+            if suite not in ENGINE_SUITES.get(engine, SUITES):
+                continue
+            for location in instances:
+                if suite == "puzzles":
+                    expected = expected_answer(location, manifest)
+                elif suite == "small":
+                    expected = small_expected(location)
+                else:
+                    expected = expected_answer(location, None)
+                logging.info(f"{engine} {location}")
+                entry = bench_instance(engine, location, expected, args.repeat, args.timeout)
+                entry["engine"] = engine
+                entry["suite"] = suite
+                results.append(entry)
+
+    summarize(results)
+
+    run = {
+        "engines": {engine: hashes[engine] for engine in engines},
+        "repeat": args.repeat,
+        "python": sys.version,
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=1)
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as f:
+            json.dump(run, f, indent=1)
+
+    wrong = [e for e in results if e["expected"] is not None
+             and e["answer"] in ("SAT", "UNSAT") and e["answer"] != e["expected"]]
+    for entry in wrong:
+        print(f"WRONG ANSWER {entry['engine']} {entry['instance']}: {entry['answer']}")
+
+    regressions = []
+    if baseline is not None:
+        regressions = compare(results, baseline, args.alpha, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['engine']} {r['instance']}: {r['baseline_median']:.4f}s -> "
+                  f"{r['median']:.4f}s (+{100 * r['slowdown']:.1f}%, p={r['p_value']:.4f})")
+
+    if wrong or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
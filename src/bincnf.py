@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""Binary file formats for CNF formulas
+
+A binary CNF file (.cnfb) holds the flat buffers of a dimacs.CNF as they are
+in memory, so loading one needs no parsing. All numbers are little endian:
+
+    header:  magic b'CNFB', format version, number of variables, number of
+             clauses, number of literals, CRC32 of the payload (6 x 4 bytes)
+    payload: the literals (int32), then the clause offsets (int32, one more
+             than the number of clauses)
+
+Clause i is lits[offsets[i]:offsets[i + 1]], as in dimacs.CNF. A file with
+another magic or version, a wrong size or a checksum that does not match is
+rejected with a BinaryFormatError.
+
+mmap_bincnf maps the file into memory instead of reading it: the lits and
+offsets of the CNF are views of the mapping, and the pages are only read
+when the clauses are. Computing the checksum would read them all, so
+read_cnf does not verify it unless asked to. It is checked when a file is
+converted or packed, and by the check command (verify_cnf).
+
+An archive (.cnfa) packs many binary CNFs into one file, for a whole corpus:
+
+    header:  magic b'CNFA', format version, number of instances,
+             offset of the index (4 + 4 + 4 + 8 bytes)
+    body:    the binary CNF of every instance, one after another
+    index:   for every instance its offset, its size, the length of its
+             name and the name itself (UTF-8), in the order they were packed
+
+An instance of an archive is named archive.cnfa#name by read_cnf and the
+batch runner, name being the path of the file it was packed from.
+
+Usage:
+    bincnf.py convert in.cnf out.cnfb
+    bincnf.py pack corpus.cnfa dat/sat dat/unsat
+    bincnf.py check out.cnfb corpus.cnfa
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from dimacs import CNF, read_dimacs
+
+MAGIC = b'CNFB'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIII')
+
+ARCHIVE_MAGIC = b'CNFA'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct('<4sIIQ')
+ENTRY = struct.Struct('<QQH')
+
+BINARY_SUFFIX = '.cnfb'
+ARCHIVE_SUFFIX = '.cnfa'
+MEMBER_SEP = '#'
+
+
+class BinaryFormatError(ValueError):
+    pass
+
+
+def _little_endian(buffer):
+    '''Returns buffer, or a byte-swapped copy of it on big endian machines'''
+    if sys.byteorder == 'little':
+        return buffer
+    buffer = array(buffer.typecode, buffer)
+    buffer.byteswap()
+    return buffer
+
+
+def pack_bincnf(cnf):
+    '''
+    Returns the bytes of a CNF in the binary format
+    '''
+    lits = _little_endian(array('i', cnf.lits))
+    offsets = _little_endian(array('i', cnf.offsets))
+    checksum = zlib.crc32(offsets, zlib.crc32(lits))
+    header = HEADER.pack(MAGIC, VERSION, cnf.num_vars, len(offsets) - 1, len(lits), checksum)
+    return header + lits.tobytes() + offsets.tobytes()
+
+
+def write_bincnf(location, cnf):
+    '''
+    Writes a CNF to location in the binary format
+    '''
+    with open(location, 'wb') as f:
+        f.write(pack_bincnf(cnf))
+
+
+def read_bincnf(location, verify=True):
+    '''
+    Reads a CNF written by write_bincnf
+    '''
+    with open(location, 'rb') as f:
+        data = f.read()
+    return parse_bincnf(data, verify)
+
+
+def mmap_bincnf(location, verify=True):
+    '''
+    Maps a CNF written by write_bincnf into memory, without copying it.
+    With verify, the checksum is computed, which reads the whole file.
+    '''
+    with open(location, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise BinaryFormatError("empty file")
+    return parse_bincnf(data, verify)
+
+
+def parse_bincnf(data, verify=True):
+    '''
+    Reads a CNF from the bytes of a binary CNF file, or any other buffer
+    holding them. The lits and offsets of the CNF are views of data where
+    the byte order allows it, else copies.
+    '''
+    if len(data) < HEADER.size:
+        raise BinaryFormatError("truncated header")
+    magic, version, num_vars, num_clauses, num_lits, checksum = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise BinaryFormatError("not a binary CNF file")
+    if version != VERSION:
+        raise BinaryFormatError(f"unsupported version {version}")
+    if len(data) != HEADER.size + 4 * (num_lits + num_clauses + 1):
+        raise BinaryFormatError("wrong size")
+
+    payload = memoryview(data)[HEADER.size:]
+    if verify and zlib.crc32(payload) != checksum:
+        raise BinaryFormatError("checksum mismatch")
+
+    lits = payload[:4 * num_lits].cast('i')
+    offsets = payload[4 * num_lits:].cast('i')
+    if sys.byteorder != 'little':
+        lits = _little_endian(array('i', lits))
+        offsets = _little_endian(array('i', offsets))
+    return CNF(num_vars, num_clauses, lits, offsets)
+
+
+def write_archive(location, entries):
+    '''
+    Packs (name, CNF) pairs into an archive
+    '''
+    index = []
+    with open(location, 'wb') as f:
+        f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0, 0))
+        offset = ARCHIVE_HEADER.size
+        for name, cnf in entries:
+            data = pack_bincnf(cnf)
+            f.write(data)
+            index.append((name, offset, len(data)))
+            offset += len(data)
+
+        for name, start, size in index:
+            encoded = name.encode()
+            f.write(ENTRY.pack(start, size, len(encoded)))
+            f.write(encoded)
+
+        f.seek(0)
+        f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, len(index), offset))
+
+
+class CNFArchive():
+    '''
+    An archive mapped into memory. The instances are read by name with
+    get, without copying them.
+
+    names: the names of the instances, in the order they were packed
+    '''
+
+    def __init__(self, location):
+        with open(location, 'rb') as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise BinaryFormatError("empty file")
+        if len(self.data) < ARCHIVE_HEADER.size:
+            raise BinaryFormatError("truncated header")
+        magic, version, count, position = ARCHIVE_HEADER.unpack_from(self.data)
+        if magic != ARCHIVE_MAGIC:
+            raise BinaryFormatError("not a CNF archive")
+        if version != ARCHIVE_VERSION:
+            raise BinaryFormatError(f"unsupported version {version}")
+
+        self.names = []
+        self.index = {}
+        try:
+            for _ in range(count):
+                start, size, length = ENTRY.unpack_from(self.data, position)
+                position += ENTRY.size
+                name = self.data[position:position + length].decode()
+                position += length
+                self.names.append(name)
+                self.index[name] = (start, size)
+        except (struct.error, UnicodeDecodeError):
+            raise BinaryFormatError("truncated index")
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def get(self, name, verify=True):
+        start, size = self.index[name]
+        return parse_bincnf(memoryview(self.data)[start:start + size], verify)
+
+
+# Archives opened by read_cnf, kept open for the other instances in them
+_ARCHIVES = {}
+
+
+def split_member(location):
+    '''
+    Returns (archive, name) for an instance of an archive, else (location, None)
+    '''
+    archive, sep, name = location.partition(ARCHIVE_SUFFIX + MEMBER_SEP)
+    if not sep:
+        return location, None
+    return archive + ARCHIVE_SUFFIX, name
+
+
+def archive_members(location):
+    '''
+    Returns the instances of an archive, named as read_cnf takes them
+    '''
+    return [location + MEMBER_SEP + name for name in CNFArchive(location)]
+
+
+def read_cnf(location, verify=False):
+    '''
+    Reads a CNF from a DIMACS file (see dimacs.py), a binary CNF file, or
+    an instance of an archive. A whole archive is rejected with a
+    BinaryFormatError, see archive_members for its instances.
+    With verify, the checksum of a binary CNF is computed, which reads the
+    whole instance up front.
+    '''
+    archive, name = split_member(location)
+    if name is None and location.endswith(ARCHIVE_SUFFIX):
+        raise BinaryFormatError(f"{location} is an archive, name one of its instances as "
+                                f"{location}{MEMBER_SEP}name")
+    if name is not None:
+        if archive not in _ARCHIVES:
+            _ARCHIVES[archive] = CNFArchive(archive)
+        return _ARCHIVES[archive].get(name, verify)
+    if location.endswith(BINARY_SUFFIX):
+        return mmap_bincnf(location, verify)
+    return read_dimacs(location)
+
+
+def verify_cnf(location):
+    '''
+    Verifies the checksum of a binary CNF file, or of every instance of an
+    archive. Raises a BinaryFormatError naming the first one that fails.
+    '''
+    if location.endswith(ARCHIVE_SUFFIX):
+        archive = CNFArchive(location)
+        for name in archive:
+            try:
+                archive.get(name, verify=True)
+            except BinaryFormatError as e:
+                raise BinaryFormatError(f"{location}{MEMBER_SEP}{name}: {e}")
+    else:
+        try:
+            mmap_bincnf(location, verify=True)
+        except BinaryFormatError as e:
+            raise BinaryFormatError(f"{location}: {e}")
+
+
+def main():
+    from batch import collect_instances
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbosity", help="increase output verbosity", action="count")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="convert a DIMACS file to a binary CNF file")
+    convert.add_argument("source", help="DIMACS file, possibly compressed")
+    convert.add_argument("target", help="binary CNF file to write")
+    pack = commands.add_parser("pack", help="pack DIMACS files into an archive")
+    pack.add_argument("archive", help="archive to write")
+    pack.add_argument("instances", nargs="+",
+                      help="directories or glob patterns of DIMACS files to pack")
+    check = commands.add_parser("check", help="verify the checksums of binary CNF files and archives")
+    check.add_argument("locations", nargs="+", help="binary CNF files or archives")
+    args = parser.parse_args()
+    if args.verbosity == 2:
+        logging.basicConfig(level=logging.DEBUG)
+    elif args.verbosity == 1:
+        logging.basicConfig(level=logging.INFO)
+    else:
+        logging.basicConfig(level=logging.WARN)
+
+    if args.command == "convert":
+        write_bincnf(args.target, read_dimacs(args.source))
+        verify_cnf(args.target)
+    elif args.command == "check":
+        for location in args.locations:
+            verify_cnf(location)
+            logging.info(f"{location}: OK")
+    else:
+        instances = [location for location in collect_instances(args.instances)
+                     if not location.endswith((BINARY_SUFFIX, ARCHIVE_SUFFIX))]
+        logging.info(f"Packing {len(instances)} instances into {args.archive}")
+        write_archive(args.archive,
+                      ((os.path.normpath(location), read_dimacs(location)) for location in instances))
+        verify_cnf(args.archive)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Streaming reader for the DIMACS CNF file format
+
+This is the one DIMACS parser of the project, used by both Loader (src/sat.py)
+and parse_dimacs in the Sudoku solver's main.py. See loader.py for a
+description of the format.
+
+The file is read in large binary chunks and every chunk is tokenized with a
+single split(), so the cost is linear in the size of the file. Files ending in
+.gz, .xz or .bz2 are decompressed on the fly.
+
+The result is a CNF holding flat integer buffers instead of a list per clause:
+
+    lits:    the literals of all clauses, one after another, without the 0s
+    offsets: clause i is lits[offsets[i]:offsets[i + 1]]
+"""
+import bz2
+import gzip
+import io
+import lzma
+from array import array
+
+CHUNK_SIZE = 1 << 20
+
+OPENERS = {
+    '.gz': gzip.open,
+    '.xz': lzma.open,
+    '.bz2': bz2.open,
+}
+
+
+class CNF():
+    '''
+    A CNF formula stored as flat integer buffers
+
+    num_vars:         number of variables, from the problem line if there is one,
+                      else the largest variable that appears
+    declared_clauses: number of clauses given on the problem line, None if the
+                      file has no problem line
+    '''
+
+    def __init__(self, num_vars, declared_clauses, lits, offsets):
+        self.num_vars = num_vars
+        self.declared_clauses = declared_clauses
+        self.lits = lits
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return f"CNF({self.num_vars} variables, {len(self)} clauses)"
+
+    def clause(self, idx):
+        return self.lits[self.offsets[idx]:self.offsets[idx + 1]]
+
+    def clauses(self):
+        '''Yields every clause as a list of ints'''
+        # Slicing one list is faster than converting every slice of the buffer
+        lits = self.lits.tolist()
+        offsets = self.offsets.tolist()
+        for idx in range(len(offsets) - 1):
+            yield lits[offsets[idx]:offsets[idx + 1]]
+
+
+def open_cnf(location):
+    '''Opens a CNF file for binary reading, decompressing it if needed'''
+    for suffix, opener in OPENERS.items():
+        if location.endswith(suffix):
+            return opener(location, 'rb')
+    return open(location, 'rb')
+
+
+def read_dimacs(source):
+    '''
+    Reads a DIMACS CNF from a file name, or from a file object opened in
+    either binary or text mode.
+    '''
+    if isinstance(source, str):
+        with open_cnf(source) as f:
+            return _read_stream(f)
+    return _read_stream(source)
+
+
+def _read_stream(f):
+    num_vars = None
+    declared_clauses = None
+    lits = array('i')
+    offsets = array('i', [0])
+
+    # Literals of a clause that has not been terminated by a 0 yet
+    pending = array('i')
+    # Incomplete last line of the previous chunk
+    leftover = b''
+    done = False
+
+    while not done:
+        chunk = f.read(CHUNK_SIZE)
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if not chunk:
+            data = leftover
+            done = True
+        else:
+            end = chunk.rfind(b'\n') + 1
+            if end == 0:
+                leftover += chunk
+                continue
+            data = leftover + chunk[:end]
+            leftover = chunk[end:]
+
+        # Fast path: a block of clause lines only
+        if b'c' not in data and b'p' not in data and b'%' not in data:
+            pending.extend(map(int, data.split()))
+        else:
+            for line in data.split(b'\n'):
+                line = line.strip()
+                if not line or line.startswith(b'c'):
+                    continue
+                if line.startswith(b'p'):
+                    fields = line.split()
+                    num_vars = int(fields[2])
+                    declared_clauses = int(fields[3])
+                elif line.startswith(b'%'):
+                    # Some testcases are terminated by %\n0
+                    done = True
+                    break
+                else:
+                    pending.extend(map(int, line.split()))
+
+        # Move every clause terminated by a 0 into the flat buffers
+        start = 0
+        while True:
+            try:
+                zero = pending.index(0, start)
+            except ValueError:
+                break
+            # A 0 on its own is an empty clause, which makes the formula UNSAT
+            lits.extend(pending[start:zero])
+            offsets.append(len(lits))
+            start = zero + 1
+        del pending[:start]
+
+    # A last clause without its terminating 0
+    if len(pending) > 0:
+        lits.extend(pending)
+        offsets.append(len(lits))
+
+    if num_vars is None:
+        num_vars = max(map(abs, lits), default=0)
+
+    return CNF(num_vars, declared_clauses, lits, offsets)
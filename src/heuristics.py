@@ -1,7 +1,15 @@
 '''
 Define your heuristics for choosing variables, and the value to assign first 
 in this file
+
+The solvers also use one of the variable orders at the bottom of this file
+when no custom heuristic is given:
+    StaticOrder: the variable with the lowest index first
+    VSIDS:       the variable with the highest (exponentially decaying) activity
+Both take a seed, which replaces the index by a random key for the order
+of StaticOrder and the ties of VSIDS.
 '''
+import heapq
 import random
 from lib import Assn
 
@@ -70,4 +78,187 @@ def choose_assn(var_, assignments, sat):
     # return Assn.TRUE if pos_instance >= neg_instance else Assn.FALSE
     # ===================================================
 
-    
+
+def tie_break_keys(size, seed=None):
+    '''
+    A distinct key for every variable: its index, or with a seed a random
+    permutation of the indices
+    '''
+    keys = list(range(size))
+    if seed is not None:
+        random.Random(seed).shuffle(keys)
+    return keys
+
+
+class StaticOrder():
+    '''
+    Picks the unassigned variable with the lowest key. The key of a variable
+    is its index, or with a seed its rank in a random permutation, so that
+    solvers with different seeds branch in different orders.
+
+    Works on variable indices, which may start at 0 (src/) or 1 (CDCLSolver).
+    The heap contains at least every unassigned variable: assigned variables
+    are only removed lazily when they reach the top, and the solver calls
+    insert() again for every variable it unassigns.
+    '''
+
+    def __init__(self, size, variables=None, seed=None):
+        # The heap holds keys, var[k] is the variable with key k
+        self.key = tie_break_keys(size, seed)
+        self.var = [0] * size
+        for v, k in enumerate(self.key):
+            self.var[k] = v
+        variables = range(size) if variables is None else variables
+        self.heap = [self.key[v] for v in variables]
+        heapq.heapify(self.heap)
+        self.in_heap = bytearray(size)
+        for v in variables:
+            self.in_heap[v] = 1
+
+    def insert(self, v):
+        if not self.in_heap[v]:
+            self.in_heap[v] = 1
+            heapq.heappush(self.heap, self.key[v])
+
+    def pick(self, is_unassigned):
+        '''
+        Returns the next unassigned variable, or None if there is none
+        '''
+        heap = self.heap
+        var = self.var
+        while heap:
+            v = var[heap[0]]
+            if is_unassigned(v):
+                return v
+            self.in_heap[var[heapq.heappop(heap)]] = 0
+        return None
+
+    def bump(self, v):
+        pass
+
+    def decay(self):
+        pass
+
+
+class VSIDS():
+    '''
+    EVSIDS branching: every variable has an activity, bumped by var_inc when
+    the variable takes part in a conflict. Instead of decaying every activity,
+    var_inc grows by 1 / decay after each conflict, which has the same effect
+    on the ordering. Activities are rescaled when they get too large.
+
+    The variables are kept in an indexed binary max-heap on activity, so the
+    pick and bump are O(log n). Like StaticOrder, assigned variables are
+    removed lazily, and insert() is called for every unassigned variable.
+    With a seed, variables of equal activity go by their random key, as in
+    StaticOrder. Without one every key is 0, and ties keep their place.
+    '''
+    RESCALE_LIMIT = 1e100
+
+    def __init__(self, size, variables=None, seed=None, decay=0.95):
+        self.activity = [0.0] * size
+        self.key = [0] * size if seed is None else tie_break_keys(size, seed)
+        self.var_inc = 1.0
+        self.decay_factor = decay
+
+        # Every activity is 0, so sorting by key makes a valid heap
+        self.heap = sorted(range(size) if variables is None else variables,
+                           key=self.key.__getitem__)
+        # position of every variable in the heap, -1 if not in it
+        self.indices = [-1] * size
+        for idx, v in enumerate(self.heap):
+            self.indices[v] = idx
+
+    def insert(self, v):
+        if self.indices[v] < 0:
+            self.indices[v] = len(self.heap)
+            self.heap.append(v)
+            self.percolate_up(self.indices[v])
+
+    def pick(self, is_unassigned):
+        '''
+        Returns the unassigned variable with the highest activity,
+        or None if there is none
+        '''
+        while self.heap:
+            v = self.heap[0]
+            if is_unassigned(v):
+                return v
+            self.remove_max()
+        return None
+
+    def remove_max(self):
+        heap = self.heap
+        top = heap[0]
+        last = heap.pop()
+        self.indices[top] = -1
+        if heap:
+            heap[0] = last
+            self.indices[last] = 0
+            self.percolate_down(0)
+        return top
+
+    def bump(self, v):
+        activity = self.activity
+        activity[v] += self.var_inc
+        if activity[v] > self.RESCALE_LIMIT:
+            for u in range(len(activity)):
+                activity[u] *= 1 / self.RESCALE_LIMIT
+            self.var_inc *= 1 / self.RESCALE_LIMIT
+
+        if self.indices[v] >= 0:
+            self.percolate_up(self.indices[v])
+
+    def decay(self):
+        self.var_inc /= self.decay_factor
+
+    def percolate_up(self, idx):
+        heap = self.heap
+        indices = self.indices
+        activity = self.activity
+        key = self.key
+        v = heap[idx]
+        act = activity[v]
+        while idx > 0:
+            parent = (idx - 1) >> 1
+            u = heap[parent]
+            if activity[u] > act or (activity[u] == act and key[u] <= key[v]):
+                break
+            heap[idx] = heap[parent]
+            indices[heap[idx]] = idx
+            idx = parent
+        heap[idx] = v
+        indices[v] = idx
+
+    def percolate_down(self, idx):
+        heap = self.heap
+        indices = self.indices
+        activity = self.activity
+        key = self.key
+        v = heap[idx]
+        act = activity[v]
+        n = len(heap)
+        while True:
+            child = 2 * idx + 1
+            if child >= n:
+                break
+            u = heap[child]
+            if child + 1 < n:
+                w = heap[child + 1]
+                if activity[w] > activity[u] or (activity[w] == activity[u] and key[w] < key[u]):
+                    child += 1
+                    u = w
+            if activity[u] < act or (activity[u] == act and key[u] >= key[v]):
+                break
+            heap[idx] = heap[child]
+            indices[heap[idx]] = idx
+            idx = child
+        heap[idx] = v
+        indices[v] = idx
+
+
+# Variable orders that can be selected by name
+VARIABLE_ORDERS = {
+    'static': StaticOrder,
+    'vsids': VSIDS,
+}
@@ -0,0 +1,151 @@
+'''
+Debugging checks for the watched literal scheme.
+
+The solver keeps two invariants while it searches:
+    - no clause has all of its vars false
+    - the watchlist of every clause and the watchedBy list of every var
+      agree with each other, and a clause never watches two false vars
+
+Checking them over the whole formula after every step is O(|formula|), so
+the checker supports several modes:
+
+    OFF:         no checking at all, the solver does not even record what changed
+    INCREMENTAL: only the clauses and watch lists touched since the last check
+    FULL:        every clause and every variable, on every check
+    SAMPLED:     a random subset of clauses and variables on every check
+'''
+import random
+from enum import Enum
+from lib import Clause, FALSE
+
+
+class CheckMode(Enum):
+    OFF = "off"
+    INCREMENTAL = "incremental"
+    FULL = "full"
+    SAMPLED = "sampled"
+
+
+class InvariantChecker():
+    '''
+    Verifies the solver invariants, see the module docstring for the modes.
+
+    The assignment reports what it changes through assigned() and touch(),
+    which is only done when a checker is attached to it.
+    '''
+
+    def __init__(self, sat, assignments, mode=CheckMode.INCREMENTAL,
+                 sample_size=32, seed=None):
+        self.sat = sat
+        self.assignments = assignments
+        self.mode = mode
+        self.sample_size = sample_size
+        self.random = random.Random(seed)
+
+        # Changes since the last check
+        self.dirty_variables = set()
+        self.touched_clauses = set()
+
+    def assigned(self, var_idx):
+        '''
+        Called when the variable with index var_idx has been assigned a value
+        '''
+        self.dirty_variables.add(var_idx)
+
+    def touch(self, clause_idx):
+        '''
+        Called when a clause has been visited by unit propagation,
+        its watchlist may have changed
+        '''
+        self.touched_clauses.add(clause_idx)
+
+    def check(self):
+        '''
+        Checks the invariants according to the mode of the checker
+        '''
+        if self.mode == CheckMode.INCREMENTAL:
+            self.check_incremental()
+        elif self.mode == CheckMode.FULL:
+            self.check_full()
+        elif self.mode == CheckMode.SAMPLED:
+            self.check_sampled()
+
+        self.dirty_variables.clear()
+        self.touched_clauses.clear()
+
+    def check_incremental(self):
+        '''
+        A clause can only break an invariant when one of the vars it watches
+        becomes false, or when its watchlist is changed. Unassigning variables
+        on backtrack cannot break anything, so it is enough to look at the
+        watch lists of the variables assigned since the last check, and at the
+        clauses unit propagation visited.
+        '''
+        watches = self.sat.watches
+        for var_idx in self.dirty_variables:
+            for lit in (2 * var_idx, 2 * var_idx + 1):
+                self.check_watched_by(lit)
+                for clause_idx in watches[lit]:
+                    self.check_clause(clause_idx)
+
+        for clause_idx in self.touched_clauses:
+            self.check_clause(clause_idx)
+
+    def check_full(self):
+        '''
+        Checks every clause and every variable of the formula
+        '''
+        for clause_idx in range(self.sat.num_clauses):
+            self.check_clause(clause_idx)
+
+        for lit in range(2 * self.sat.num_vars):
+            self.check_watched_by(lit)
+
+    def check_sampled(self):
+        '''
+        Checks a random sample of the clauses and variables of the formula
+        '''
+        num_clauses = self.sat.num_clauses
+        for clause_idx in self.random.sample(range(num_clauses), min(self.sample_size, num_clauses)):
+            self.check_clause(clause_idx)
+
+        num_vars = self.sat.num_vars
+        for var_idx in self.random.sample(range(num_vars), min(self.sample_size, num_vars)):
+            self.check_watched_by(2 * var_idx)
+            self.check_watched_by(2 * var_idx + 1)
+
+    def check_clause(self, clause_idx):
+        '''
+        Checking that the clause is not already unsatisfiable, and that
+        its watchlist is consistent
+        '''
+        value = self.assignments.value
+        lits = self.sat.clause_lits(clause_idx)
+
+        num_false = 0
+        # Check not all assignments false
+        for lit in lits:
+            if value[lit] == FALSE:
+                num_false += 1
+        assert num_false < len(lits), "Invariants broken, clause:" + self.pp(clause_idx)
+
+        # Check that watched by and watching is consistent
+        for lit in lits[:2]:
+            assert clause_idx in self.sat.watches[lit], "watchedBy inconsistent with watchlist"
+
+        # Check that what we are watching is not both false
+        assert value[lits[0]] != FALSE or value[lits[1]] != FALSE, \
+            "Cannot be watching both literals false: " + self.pp(clause_idx)
+
+    def check_watched_by(self, lit):
+        '''
+        Checking that every clause watched by lit is watching lit
+        '''
+        sat = self.sat
+        for clause_idx in sat.watches[lit]:
+            start = sat.starts[clause_idx]
+            assert sat.lits[start] == lit or sat.lits[start + 1] == lit, \
+                "Watchlist/watched by invariants broken"
+
+    def pp(self, clause_idx):
+        return Clause(self.sat, clause_idx).pp(self.assignments)
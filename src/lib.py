@@ -1,9 +1,22 @@
+from array import array
 from enum import Enum
 from typing import List
 import logging
 
-# Global map of all variables defined
-VARIABLES = {}
+'''
+The formula is stored in a compact integer core, see SAT. The classes Var,
+Variable and Clause are light views over that core, used for the public API
+and for debug printing.
+
+Literals are encoded as ints: for the variable with index v (0-based, in order
+of first appearance), the literal x is 2*v and NOT x is 2*v + 1, so the
+negation of a literal is lit ^ 1 and its variable is lit >> 1.
+
+Values are stored per literal in a bytearray, as one of the constants below.
+'''
+FALSE = 0
+TRUE = 1
+UNKNOWN = 2
 
 
 class UnsatException(Exception):
@@ -37,45 +50,48 @@ class Assn(Enum):
             return Assn.FALSE
 
 
+# Assn for each of the value constants FALSE, TRUE, UNKNOWN
+ASSN_OF_VALUE = (Assn.FALSE, Assn.TRUE, Assn.UNKNOWN)
+
+
 class Var():
     '''
     Represents either x or NOT x, where x is a Variable
-    This is what actually appears in a clause. 
-    Var are singletons, and new Vars should only be instantiated
-    with VarFactory
+    This is what actually appears in a clause.
+    Var are singletons within a SAT instance, and new Vars should only be
+    instantiated with SAT.get_var
 
     self.neg: Whether the literal is x or not x
     self.var: base variable
+    self.lit: the literal in the integer core
     '''
 
     def __init__(self, var_, neg=False):
         self.neg = neg
         self.var = var_
-        self.watchedBy = []
+        self.lit = 2 * var_.idx + neg
 
     def __repr__(self):
         if self.neg:
           return "¬" + repr(self.var)
         return repr(self.var)
 
-    def addWatchedBy(self, clause):
-        if clause not in self.watchedBy:
-          self.watchedBy.append(clause)
-
-    def removeWatchedBy(self, clause):
-        self.watchedBy.remove(clause)
+    @property
+    def watchedBy(self):
+        return self.watchingClauses()
 
     def isNeg(self):
         return self.neg
 
     def watchingClauses(self):
-        return self.watchedBy
+        sat = self.var.sat
+        return [Clause(sat, clause_idx) for clause_idx in sat.watches[self.lit]]
 
 
 class Variable():
     '''
     Represents an abstract variable, i.e x
-    This does not contain info on whether it is negated, 
+    This does not contain info on whether it is negated,
     that falls under the domain of Var.
 
     So normally, we have a relationship that looks like this:
@@ -84,16 +100,17 @@ class Variable():
     Variable (x) /
                  \------Var (NOT x)
 
-    Variables are singletons, and is implicitly created
-    by VarFactory when instantiating Vars.
+    Variables are singletons within a SAT instance, and is implicitly created
+    by SAT.get_var when instantiating Vars.
 
     label: the label of the variable
+    idx:   index of the variable in the integer core
     '''
 
-    def __init__(self, label: int):
-        assert label not in VARIABLES
+    def __init__(self, sat, idx: int, label: int):
+        self.sat = sat
+        self.idx = idx
         self.label = label
-        VARIABLES[label] = self
         self.pos = Var(self, False)
         self.neg = Var(self, True)
 
@@ -111,31 +128,26 @@ class Variable():
         return self.neg
 
 
-class VarFactory():
+class Clause():
     '''
-    Factory for getting singleton vars
+    A CNF clause, as a view of clause clause_idx in the integer core.
+    The two literals being watched are always the first two of the clause.
     '''
-    @staticmethod
-    def get_var(label: int, neg: bool):
-        if label in VARIABLES:
-            return VARIABLES[label].getNeg() if neg else VARIABLES[label].getPos()
-        var_ = Variable(label)
-        return var_.getNeg() if neg else var_.getPos()
+    def __init__(self, sat, clause_idx: int):
+        self.sat = sat
+        self.idx = clause_idx
+        self.watchlist = [0, 1]
 
+    def __eq__(self, other):
+        return isinstance(other, Clause) and self.sat is other.sat and self.idx == other.idx
 
-class Clause():
-    '''
-    A CNF clause
-    '''
-    def __init__(self, variables: List[Var]):
-        self.vars = variables
-        assert len(self.vars) >= 2  # Temporary assumption
+    def __hash__(self):
+        return self.idx
 
-        # Initialize watchlist on first two indices
-        # Watchlist contains index of variables watched
-        self.watchlist = [0, 1]
-        self.vars[0].addWatchedBy(self)
-        self.vars[1].addWatchedBy(self)
+    @property
+    def vars(self) -> List[Var]:
+        sat = self.sat
+        return [sat.var_of_lit(lit) for lit in sat.clause_lits(self.idx)]
 
     def __repr__(self):
         l = []
@@ -167,79 +179,115 @@ class Clause():
         '''
         Returns if at least one of the variables that this clause is watching is true
         '''
-        var1 = self.vars[self.watchlist[0]]
-        var2 = self.vars[self.watchlist[1]]
-        return assignment.get_assignment_val(var1) == Assn.TRUE or \
-            assignment.get_assignment_val(var2) == Assn.TRUE
+        lits = self.sat.clause_lits(self.idx)
+        return assignment.value[lits[0]] == TRUE or assignment.value[lits[1]] == TRUE
 
     def is_not_just_watching_false(self, assignment):
         '''
         Returns if at least one of the variables that this clause is watching is non-false
         '''
-        var1 = self.vars[self.watchlist[0]]
-        var2 = self.vars[self.watchlist[1]]
-        return assignment.get_assignment_val(var1) != Assn.FALSE or \
-            assignment.get_assignment_val(var2) != Assn.FALSE
+        lits = self.sat.clause_lits(self.idx)
+        return assignment.value[lits[0]] != FALSE or assignment.value[lits[1]] != FALSE
 
-    def resolve_watch(self, var_to_change: Var, assignment):
-        '''
-        Called when both literals being watched is false
-        This function tries to find another literal to watch instead of var_to_change
 
-        If it succeeds, returns 0
-        Else returns negative int
-        '''
-        logging.debug("Resolving clause " + self.pp(assignment) +
-                      " due to " + repr(var_to_change))
+class SAT():
+    '''
+    A SAT formula in CNF form
 
-        # Find index in watchlist
-        to_change_wl_idx = 0 if self.vars[self.watchlist[0]
-                                          ] == var_to_change else 1
-        other_wl_idx = 1 - to_change_wl_idx
-        to_change_var_idx = self.watchlist[to_change_wl_idx]
-        other_var_idx = self.watchlist[other_wl_idx]
+    Each SAT instance owns its variables (and through them the vars and their
+    watch lists), so any number of instances can be loaded and solved in the
+    same process.
 
-        new_idx = -1  # new idx to watch
-        for idx, var in enumerate(self.vars):
-            if idx == to_change_var_idx or idx == other_var_idx:
-                continue
+    The formula itself is kept in flat integer arrays:
 
-            # Check if not false
-            if assignment.get_assignment_val(var) != Assn.FALSE:
-                new_idx = idx
-                break
+    lits:      literals of all clauses, one after another
+    starts:    clause i is lits[starts[i]:starts[i + 1]]
+    watches:   watches[lit] holds the indices of the clauses watching lit
+    labels:    labels[v] is the DIMACS label of the variable with index v
+    variables: map of label to Variable, in order of first appearance
 
-        # If not possible to find any other index to watch because everything else is false, then the other literal being watched must be false
-        if new_idx == -1:
-            other_watched_var = self.vars[other_var_idx]
-            if assignment.get_assignment_val(other_watched_var) == Assn.FALSE:
-                # If already assigned to false, we have a contradiction, need
-                # to backtrack
-                return -1
+    Clauses learned during the search are appended after the clauses of the
+    formula, num_learnts counts them.
 
-            # Else we force it to the value that makes it true
-            assn_val = Assn.FALSE if other_watched_var.isNeg() else Assn.TRUE
-            assignment.assign(other_watched_var.var, assn_val)
-        else:
-            # Else watch the indeterminate/truthy thing we found
-            self.watchlist[to_change_wl_idx] = new_idx
-            var_to_change.removeWatchedBy(self)
-            self.vars[new_idx].addWatchedBy(self)
+    preprocessor is the Preprocessor the formula went through before it was
+    loaded, if any, and is needed to extend models to the removed variables.
+    '''
 
-        logging.debug(f"New wl: {self.watchlist}")
-        assert self.watchlist[0] != self.watchlist[1]
+    def __init__(self):
+        self.lits = array('i')
+        self.starts = array('i', [0])
+        self.watches = []
+        self.labels = array('i')
+        self.variables = {}
+        self.num_learnts = 0
+        self.preprocessor = None
 
-        return 0
+    def __repr__(self):
+        return " ∧ ".join([repr(c) for c in self.clauses])
 
+    @property
+    def num_vars(self):
+        return len(self.labels)
 
-class SAT():
-    '''
-    A SAT formula in CNF form
-    '''
+    @property
+    def num_clauses(self):
+        return len(self.starts) - 1
 
-    def __init__(self, clauses):
-        self.clauses = clauses
+    @property
+    def clauses(self) -> List[Clause]:
+        return [Clause(self, clause_idx) for clause_idx in range(self.num_clauses)]
 
-    def __repr__(self):
-        return " ∧ ".join([repr(c) for c in self.clauses])
+    def clause_lits(self, clause_idx: int):
+        return self.lits[self.starts[clause_idx]:self.starts[clause_idx + 1]]
+
+    def var_of_lit(self, lit: int) -> Var:
+        variable = self.variables[self.labels[lit >> 1]]
+        return variable.getNeg() if lit & 1 else variable.getPos()
+
+    def get_var(self, label: int, neg: bool):
+        '''
+        Get the singleton var for label in this instance, creating its
+        Variable on first use
+        '''
+        variable = self.variables.get(label)
+        if variable is None:
+            variable = Variable(self, len(self.labels), label)
+            self.variables[label] = variable
+            self.labels.append(label)
+            self.watches.append(array('i'))
+            self.watches.append(array('i'))
+        return variable.getNeg() if neg else variable.getPos()
+
+    def add_clause(self, lits: List[int]):
+        '''
+        Adds a clause given as DIMACS-style ints, and watches its
+        first two literals
+        '''
+        assert len(lits) >= 2  # Temporary assumption
+
+        clause_idx = self.num_clauses
+        for lit in lits:
+            core_lit = self.get_var(abs(lit), lit < 0).lit
+            self.lits.append(core_lit)
+        self.starts.append(len(self.lits))
+
+        start = self.starts[clause_idx]
+        self.watches[self.lits[start]].append(clause_idx)
+        self.watches[self.lits[start + 1]].append(clause_idx)
+
+    def add_learnt(self, lits: List[int]) -> int:
+        '''
+        Adds a learned clause given as literals of the integer core, over
+        variables that already exist, and watches its first two literals.
+        Returns the index of the new clause.
+        '''
+        assert len(lits) >= 2
+
+        clause_idx = self.num_clauses
+        self.lits.extend(lits)
+        self.starts.append(len(self.lits))
+        self.num_learnts += 1
 
+        self.watches[lits[0]].append(clause_idx)
+        self.watches[lits[1]].append(clause_idx)
+        return clause_idx
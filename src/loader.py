@@ -13,61 +13,54 @@ Positive numbers indicate positive occurrence, negative numbes
 represent negated occurrence.
 
 """
-import re
+import io
 import logging
-from lib import Variable, Assn, Var, Clause, SAT, VarFactory, VARIABLES
+from bincnf import read_cnf
+from dimacs import read_dimacs
+from lib import SAT, UnsatException
+from preprocess import Preprocessor
 
 
 class Loader():
     @staticmethod
-    def load(s):
+    def load(s, preprocess=False):
         """Loads a SAT expression
         """
-        VARIABLES = {}
-        clauses = []
+        return Loader.load_cnf(read_dimacs(io.BytesIO(s.encode())), preprocess)
 
-        lines = s.split('\n')
-
-        pComment = re.compile(r'c.*')
-        pStats = re.compile(r'p\s*cnf\s*(\d*)\s*(\d*)')
-        pEnd = re.compile(r'%')  # Some testcases are terminated by %\n0
-
-        while len(lines) > 0:
-            line = lines.pop(0)
-
-            # Only deal with lines that aren't comments
-            if not pComment.match(line):
-                e = pEnd.match(line)
-                if e:
-                    break
+    @staticmethod
+    def load_cnf(cnf, preprocess=False):
+        """Builds a SAT expression from the flat buffers of a dimacs.CNF
 
-                m = pStats.match(line)
+        With preprocess, the formula is simplified first (see preprocess.py),
+        the Preprocessor is kept as sat.preprocessor to extend models, and
+        UnsatException is raised if the formula has an empty clause, or if
+        preprocessing already refutes it.
+        """
+        logging.info(f"CNF with {cnf.num_vars} variables and {cnf.declared_clauses} clauses")
 
-                if not m:
-                    nums = line.rstrip('\n').split(' ')
-                    l = []
-                    for lit in nums:
-                        if lit != '':
-                            if int(lit) == 0:
-                                continue
-                            num = abs(int(lit))
-                            neg = False
-                            if int(lit) < 0:
-                                neg = True
-                            l.append(VarFactory.get_var(num, neg))
+        clauses = cnf.clauses()
+        preprocessor = None
+        if preprocess:
+            preprocessor = Preprocessor(clauses, cnf.num_vars)
+            if not preprocessor.run():
+                raise UnsatException()
+            clauses = preprocessor.simplified()
 
-                    if len(l) > 0:
-                        # Use set to dedupe
-                        clauses.append(Clause(l))
-                else:
-                    logging.info(f"CNF with {m[1]} variables and {m[2]} clauses")
+        sat = SAT()
+        sat.preprocessor = preprocessor
+        for lits in clauses:
+            if len(lits) == 0:
+                raise UnsatException()
+            sat.add_clause(lits)
 
-        return SAT(clauses)
+        return sat
 
     @staticmethod
-    def load_file(location):
-        """Loads a CNF from a file."""
-        with open(location) as f:
-            s = f.read()
+    def load_file(location, preprocess=False):
+        """Loads a CNF from a file, which may be compressed (.gz, .xz, .bz2).
 
-        return Loader.load(s)
+        Binary CNF files (.cnfb) and instances of archives (archive.cnfa#name)
+        are mapped into memory instead of parsed, see bincnf.py.
+        """
+        return Loader.load_cnf(read_cnf(location), preprocess)
@@ -0,0 +1,477 @@
+'''
+CNF preprocessing, run on a formula before the search starts.
+
+The preprocessor simplifies the formula and keeps enough information to turn
+a model of the simplified formula back into a model of the original one:
+
+    units:         top-level unit propagation, satisfied clauses are removed
+                   and false literals are dropped
+    duplicates:    clauses with the same literals are kept once
+    equivalences:  literals that imply each other through binary clauses
+                   (strongly connected components of the implication graph)
+                   are replaced by one representative
+    subsumption:   a clause that contains all the literals of another clause
+                   is removed
+    strengthening: self-subsuming resolution, if C with one literal l negated
+                   is a subset of D, then -l is removed from D
+    elimination:   bounded variable elimination, a variable is resolved away
+                   when the resolvents are no more numerous than the clauses
+                   they replace, and none of them is too long
+
+Clauses are found through occurrence lists (occ[lit] holds the indices of the
+clauses containing lit) and filtered with 64-bit signatures of their
+variables before they are compared.
+
+Variables keep their numbers, fixed and eliminated variables simply do not
+appear in the simplified formula anymore. Every removal that affects models
+is pushed on a reconstruction stack as (pivot, clause). extend_model goes
+through the stack backwards and makes pivot true whenever its clause is
+not satisfied, the same way as MiniSat's SimpSolver.
+'''
+import logging
+import time
+from typing import Dict, Iterable, List, Set
+
+
+def signature(clause: List[int]) -> int:
+    sig = 0
+    for lit in clause:
+        sig |= 1 << (abs(lit) & 63)
+    return sig
+
+
+class Preprocessor():
+    '''
+    clauses:          DIMACS-style clauses, lists of non-zero ints
+    num_vars:         number of variables of the formula
+    eliminate:        whether to run bounded variable elimination
+    subsume_limit:    occurrence lists longer than this are not searched for
+                      subsumed clauses
+    resolvent_limit:  a variable is not eliminated if one of its resolvents
+                      would be longer than this
+    grow:             number of clauses elimination may add for one variable
+    rounds:           maximum number of rounds of equivalences, subsumption
+                      and elimination
+    '''
+
+    def __init__(self, clauses: Iterable[Iterable[int]], num_vars: int, eliminate: bool = True,
+                 subsume_limit: int = 1000, resolvent_limit: int = 20, grow: int = 0,
+                 rounds: int = 3):
+        self.num_vars = num_vars
+        self.eliminate = eliminate
+        self.subsume_limit = subsume_limit
+        self.resolvent_limit = resolvent_limit
+        self.grow = grow
+        self.rounds = rounds
+
+        # Clause store: clauses[i] is None once clause i has been removed
+        self.clauses: List[List[int] | None] = []
+        self.sigs: List[int] = []
+        self.occ: Dict[int, Set[int]] = {}
+        for v in range(1, num_vars + 1):
+            self.occ[v] = set()
+            self.occ[-v] = set()
+
+        # value[v] is True/False once v is fixed at the top level, else None
+        self.value: List[bool | None] = [None] * (num_vars + 1)
+        # removed[v] is True once v has been substituted or eliminated
+        self.removed: List[bool] = [False] * (num_vars + 1)
+
+        # Units waiting to be propagated, and clauses waiting to be checked
+        # for subsumption
+        self.units: List[int] = []
+        self.queue: List[int] = []
+
+        # Reconstruction stack of (pivot, clause), see extend_model
+        self.stack: List[tuple] = []
+
+        # False once the formula is known to be unsatisfiable
+        self.ok: bool = True
+
+        # Statistics
+        self.original_clauses = 0
+        self.duplicates = 0
+        self.fixed = 0
+        self.substituted = 0
+        self.eliminated = 0
+        self.subsumed = 0
+        self.strengthened = 0
+        self.time = 0.0
+
+        # Units are applied as soon as they are known, before the clauses after
+        # them are stored, so most clauses they satisfy are never indexed
+        keys = set()
+        rest = []
+        for lits in clauses:
+            self.original_clauses += 1
+            key = tuple(sorted(set(lits)))
+            if key in keys:
+                self.duplicates += 1
+                continue
+            keys.add(key)
+            if len(key) == 1:
+                self.units.append(key[0])
+            else:
+                rest.append(key)
+
+        if self.propagate():
+            for clause in rest:
+                if not self.add_clause(clause) or (self.units and not self.propagate()):
+                    break
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "original_clauses": self.original_clauses,
+            "clauses": sum(1 for clause in self.clauses if clause is not None),
+            "duplicates": self.duplicates,
+            "fixed": self.fixed,
+            "substituted": self.substituted,
+            "eliminated": self.eliminated,
+            "subsumed": self.subsumed,
+            "strengthened": self.strengthened,
+            "time": round(self.time, 6),
+        }
+
+    # ------------------------------
+    # Clause store
+    # ------------------------------
+
+    def add_clause(self, lits: Iterable[int]) -> bool:
+        '''
+        Adds a clause, simplified by the current top-level values.
+        Units are queued for propagation instead of being stored.
+        Returns False if the clause is empty, so the formula is unsatisfiable.
+        '''
+        value = self.value
+        clause = []
+        for lit in lits:
+            val = value[abs(lit)]
+            if val is None:
+                if -lit in clause:
+                    return True  # Tautology
+                if lit not in clause:
+                    clause.append(lit)
+            elif val == (lit > 0):
+                return True  # Satisfied
+
+        if not clause:
+            self.ok = False
+            return False
+        if len(clause) == 1:
+            self.units.append(clause[0])
+            return True
+
+        clause_idx = len(self.clauses)
+        self.clauses.append(clause)
+        self.sigs.append(signature(clause))
+        for lit in clause:
+            self.occ[lit].add(clause_idx)
+        self.queue.append(clause_idx)
+        return True
+
+    def remove_clause(self, clause_idx: int):
+        for lit in self.clauses[clause_idx]:
+            self.occ[lit].discard(clause_idx)
+        self.clauses[clause_idx] = None
+
+    def strengthen(self, clause_idx: int, lit: int):
+        '''
+        Removes the false or redundant literal lit from a clause
+        '''
+        clause = self.clauses[clause_idx]
+        clause.remove(lit)
+        self.occ[lit].discard(clause_idx)
+        if len(clause) == 1:
+            self.units.append(clause[0])
+            self.remove_clause(clause_idx)
+        else:
+            self.sigs[clause_idx] = signature(clause)
+            self.queue.append(clause_idx)
+
+    def simplified(self) -> List[List[int]]:
+        '''
+        Returns the simplified formula
+        '''
+        return [list(clause) for clause in self.clauses if clause is not None]
+
+    # ------------------------------
+    # Simplifications
+    # ------------------------------
+
+    def run(self) -> bool:
+        '''
+        Simplifies the formula, returns False if it is found unsatisfiable
+        '''
+        start = time.perf_counter()
+        try:
+            if not self.propagate():
+                return False
+            for _ in range(self.rounds):
+                before = (self.fixed, self.substituted, self.eliminated)
+                if not self.substitute_equivalences():
+                    return False
+                if not self.subsume():
+                    return False
+                if self.eliminate and not self.eliminate_vars():
+                    return False
+                if not self.subsume():
+                    return False
+                if (self.fixed, self.substituted, self.eliminated) == before:
+                    break
+            return True
+        finally:
+            self.time = time.perf_counter() - start
+            logging.info(f"Preprocessing: {self.stats()}")
+
+    def propagate(self) -> bool:
+        '''
+        Propagates the queued units at the top level
+        '''
+        value = self.value
+        occ = self.occ
+        while self.units and self.ok:
+            lit = self.units.pop()
+            v = abs(lit)
+            if value[v] is not None:
+                if value[v] != (lit > 0):
+                    self.ok = False
+                continue
+
+            value[v] = lit > 0
+            self.fixed += 1
+            self.stack.append((lit, [lit]))
+            for clause_idx in list(occ[lit]):
+                self.remove_clause(clause_idx)
+            for clause_idx in list(occ[-lit]):
+                self.strengthen(clause_idx, -lit)
+        return self.ok
+
+    def substitute_equivalences(self) -> bool:
+        '''
+        Replaces every literal by the representative of its strongly connected
+        component in the binary implication graph (the literal of that
+        component with the smallest variable)
+        '''
+        graph: Dict[int, List[int]] = {}
+        for clause in self.clauses:
+            if clause is not None and len(clause) == 2:
+                a, b = clause
+                graph.setdefault(-a, []).append(b)
+                graph.setdefault(-b, []).append(a)
+
+        for component in strongly_connected(graph):
+            if len(component) < 2:
+                continue
+            rep = min(component, key=abs)
+            for lit in component:
+                if -lit == rep:
+                    self.ok = False
+                    return False
+                u = abs(lit)
+                if lit == rep or self.removed[u]:
+                    continue
+                # u is equivalent to r, so every occurrence of u becomes r
+                r = rep if lit > 0 else -rep
+                self.removed[u] = True
+                self.substituted += 1
+                self.stack.append((u, [u, -r]))
+                self.stack.append((-u, [-u, r]))
+                for clause_idx in list(self.occ[u]) + list(self.occ[-u]):
+                    clause = self.clauses[clause_idx]
+                    self.remove_clause(clause_idx)
+                    if not self.add_clause([r if l == u else -r if l == -u else l for l in clause]):
+                        return False
+
+        return self.propagate()
+
+    @staticmethod
+    def subsumes(clause: List[int], other: List[int]) -> int | None:
+        '''
+        Returns 0 if clause subsumes other, a literal l of clause if clause with
+        l negated subsumes other (so other can lose -l), and None otherwise
+        '''
+        flipped = 0
+        for lit in clause:
+            if lit in other:
+                continue
+            if flipped == 0 and -lit in other:
+                flipped = lit
+                continue
+            return None
+        return flipped
+
+    def subsume(self) -> bool:
+        '''
+        Backward subsumption and strengthening with every queued clause
+        '''
+        clauses = self.clauses
+        sigs = self.sigs
+        occ = self.occ
+        while self.queue:
+            clause_idx = self.queue.pop()
+            clause = clauses[clause_idx]
+            if clause is None:
+                continue
+
+            # Every clause subsumed or strengthened by this one contains the
+            # variable of best
+            best = min(clause, key=lambda lit: len(occ[lit]) + len(occ[-lit]))
+            if len(occ[best]) + len(occ[-best]) > self.subsume_limit:
+                continue
+
+            sig = sigs[clause_idx]
+            size = len(clause)
+            for other_idx in list(occ[best]) + list(occ[-best]):
+                other = clauses[other_idx]
+                if other_idx == clause_idx or other is None or len(other) < size \
+                        or sig & ~sigs[other_idx]:
+                    continue
+                lit = self.subsumes(clause, other)
+                if lit is None:
+                    continue
+                if lit == 0:
+                    self.remove_clause(other_idx)
+                    self.subsumed += 1
+                else:
+                    self.strengthen(other_idx, -lit)
+                    self.strengthened += 1
+
+            if not self.propagate():
+                return False
+        return True
+
+    def eliminate_vars(self) -> bool:
+        '''
+        Bounded variable elimination, cheapest variables first
+        '''
+        occ = self.occ
+        candidates = [v for v in range(1, self.num_vars + 1)
+                      if self.value[v] is None and not self.removed[v]
+                      and (occ[v] or occ[-v])]
+        candidates.sort(key=lambda v: len(occ[v]) + len(occ[-v]))
+        for v in candidates:
+            if self.value[v] is None and not self.removed[v]:
+                if not self.eliminate_var(v) or not self.propagate():
+                    return False
+        return True
+
+    def eliminate_var(self, v: int) -> bool:
+        '''
+        Eliminates v by resolution if that does not grow the formula
+        '''
+        clauses = self.clauses
+        pos = list(self.occ[v])
+        neg = list(self.occ[-v])
+        limit = len(pos) + len(neg) + self.grow
+
+        resolvents = []
+        for p in pos:
+            for n in neg:
+                resolvent = self.resolve(clauses[p], clauses[n], v)
+                if resolvent is None:
+                    continue
+                if len(resolvent) > self.resolvent_limit or len(resolvents) == limit:
+                    return True
+                resolvents.append(resolvent)
+
+        # Keep the clauses of the rarer side: after the unit below has made
+        # the other side true, one of them may need v flipped to be satisfied
+        side, kept = (v, pos) if len(pos) <= len(neg) else (-v, neg)
+        for clause_idx in kept:
+            self.stack.append((side, list(clauses[clause_idx])))
+        self.stack.append((-side, [-side]))
+
+        for clause_idx in pos + neg:
+            self.remove_clause(clause_idx)
+        self.removed[v] = True
+        self.eliminated += 1
+
+        for resolvent in resolvents:
+            if not self.add_clause(resolvent):
+                return False
+        return True
+
+    @staticmethod
+    def resolve(clause: List[int], other: List[int], v: int) -> List[int] | None:
+        '''
+        Resolvent of clause (containing v) and other (containing -v),
+        None if it is a tautology
+        '''
+        lits = set(clause)
+        lits.discard(v)
+        for lit in other:
+            if lit == -v:
+                continue
+            if -lit in lits:
+                return None
+            lits.add(lit)
+        return list(lits)
+
+    # ------------------------------
+    # Model reconstruction
+    # ------------------------------
+
+    def extend_model(self, model: Iterable[int]) -> List[int]:
+        '''
+        Turns a DIMACS-style model of the simplified formula into a model of
+        the original formula, over variables 1..num_vars
+        '''
+        value = [False] * (self.num_vars + 1)
+        for lit in model:
+            if abs(lit) <= self.num_vars:
+                value[abs(lit)] = lit > 0
+
+        for pivot, clause in reversed(self.stack):
+            for lit in clause:
+                if value[abs(lit)] == (lit > 0):
+                    break
+            else:
+                value[abs(pivot)] = pivot > 0
+
+        return [v if value[v] else -v for v in range(1, self.num_vars + 1)]
+
+
+def strongly_connected(graph: Dict[int, List[int]]) -> List[List[int]]:
+    '''
+    Strongly connected components of a directed graph given as adjacency
+    lists, with Tarjan's algorithm (iterative, the graphs can be deep)
+    '''
+    index: Dict[int, int] = {}
+    low: Dict[int, int] = {}
+    on_stack: Set[int] = set()
+    stack: List[int] = []
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph.get(succ, ()))))
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        lit = stack.pop()
+                        on_stack.discard(lit)
+                        component.append(lit)
+                        if lit == node:
+                            break
+                    components.append(component)
+    return components
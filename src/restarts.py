@@ -0,0 +1,143 @@
+'''
+Restart policies for the CDCL search loop
+
+Every policy is told about each conflict, with the LBD of the clause learned
+from it, and answers whether the solver should restart now:
+
+    NoRestarts:        never restart
+    LubyRestarts:      restart after unit * luby(i) conflicts, for i = 1, 2, ...
+    GeometricRestarts: restart after first, first * factor, first * factor^2, ...
+                       conflicts
+    GlucoseRestarts:   dynamic restarts that compare a fast and a slow
+                       exponential moving average of the LBD of learned clauses,
+                       and restart when recent clauses are much worse than usual
+
+Policies are selected by name through RESTART_POLICIES, and their parameters
+are passed as keyword arguments.
+'''
+
+
+def luby(i):
+    '''
+    i-th element (1-based) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, ...
+    '''
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while i != (1 << k) - 1:
+        # i lies in the second copy of the previous subsequence
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+class NoRestarts():
+    def __init__(self):
+        self.restarts = 0
+
+    def on_conflict(self, lbd):
+        pass
+
+    def should_restart(self):
+        return False
+
+    def on_restart(self):
+        self.restarts += 1
+
+
+class LubyRestarts():
+    '''
+    unit: number of conflicts for a 1 in the Luby sequence
+    '''
+
+    def __init__(self, unit=100):
+        self.unit = unit
+        self.restarts = 0
+        self.conflicts = 0
+        self.limit = unit * luby(1)
+
+    def on_conflict(self, lbd):
+        self.conflicts += 1
+
+    def should_restart(self):
+        return self.conflicts >= self.limit
+
+    def on_restart(self):
+        self.restarts += 1
+        self.conflicts = 0
+        self.limit = self.unit * luby(self.restarts + 1)
+
+
+class GeometricRestarts():
+    '''
+    first:  number of conflicts before the first restart
+    factor: growth of the interval after each restart
+    '''
+
+    def __init__(self, first=100, factor=1.5):
+        self.factor = factor
+        self.restarts = 0
+        self.conflicts = 0
+        self.limit = first
+
+    def on_conflict(self, lbd):
+        self.conflicts += 1
+
+    def should_restart(self):
+        return self.conflicts >= self.limit
+
+    def on_restart(self):
+        self.restarts += 1
+        self.conflicts = 0
+        self.limit *= self.factor
+
+
+class GlucoseRestarts():
+    '''
+    fast_alpha:    smoothing factor of the fast moving average of LBD
+    slow_alpha:    smoothing factor of the slow moving average of LBD
+    margin:        restart when fast average > margin * slow average
+    min_conflicts: minimum number of conflicts between two restarts
+    '''
+
+    def __init__(self, fast_alpha=1 / 32, slow_alpha=1 / 16384, margin=1.25, min_conflicts=50):
+        self.fast_alpha = fast_alpha
+        self.slow_alpha = slow_alpha
+        self.margin = margin
+        self.min_conflicts = min_conflicts
+        self.restarts = 0
+        self.conflicts = 0
+        self.fast = 0.0
+        self.slow = 0.0
+        # Sums of the weights so far, to correct the bias of starting at 0
+        self.fast_weight = 0.0
+        self.slow_weight = 0.0
+
+    def on_conflict(self, lbd):
+        self.conflicts += 1
+        self.fast += self.fast_alpha * (lbd - self.fast)
+        self.slow += self.slow_alpha * (lbd - self.slow)
+        self.fast_weight += self.fast_alpha * (1 - self.fast_weight)
+        self.slow_weight += self.slow_alpha * (1 - self.slow_weight)
+
+    def should_restart(self):
+        if self.conflicts < self.min_conflicts:
+            return False
+        fast = self.fast / self.fast_weight
+        slow = self.slow / self.slow_weight
+        return fast > self.margin * slow
+
+    def on_restart(self):
+        self.restarts += 1
+        self.conflicts = 0
+
+
+# Restart policies that can be selected by name
+RESTART_POLICIES = {
+    'none': NoRestarts,
+    'luby': LubyRestarts,
+    'geometric': GeometricRestarts,
+    'glucose': GlucoseRestarts,
+}
@@ -4,61 +4,137 @@ import re
 import logging
 import argparse
 from loader import Loader
-from lib import Variable, Assn, Var, Clause, SAT, UnsatException, VARIABLES
+from bincnf import ARCHIVE_SUFFIX, archive_members
+from lib import Variable, Assn, Var, Clause, SAT, UnsatException, TRUE
 from typing import List
 from assignment import Assignment
-from heuristics import choose_assn
+from heuristics import choose_assn, VARIABLE_ORDERS
+from invariants import CheckMode, InvariantChecker
+
+
+# Search modes of SATSolver
+MODES = ('dpll', 'cdcl')
 
 
 class SATSolver():
-    def __init__(self, sat):
-        self.assignments = Assignment(VARIABLES, sat)
+    '''
+    mode: 'dpll' backtracks chronologically and learns nothing, 'cdcl' learns
+          a clause from every conflict (1-UIP) and backjumps to its
+          assertion level
+    '''
+
+    def __init__(self, sat, check_mode=CheckMode.OFF, order='static', mode='dpll'):
+        assert mode in MODES, f"Unknown mode {mode}"
+        self.assignments = Assignment(sat.variables, sat, order)
         self.sat = sat
+        self.mode = mode
+        self.decisions = 0
+        self.conflicts = 0
+
+        # Invariant checking is for debugging only, by default nothing is checked
+        self.checker = None
+        if check_mode != CheckMode.OFF:
+            self.checker = InvariantChecker(sat, self.assignments, check_mode)
+            self.assignments.checker = self.checker
 
     def check_invariants(self):
         '''
-        Checking that we don't have any clause that is already unsatisfiable
-        Mainly for debugging purposes
-        '''
-        for clause in self.sat.clauses:
-            num_false = 0
-            # Check not all assignments false
-            for var_ in clause.vars:
-                if self.assignments.get_assignment_val(var_) == Assn.FALSE:
-                    num_false += 1
-            assert num_false < len(clause.vars), "Invariants broken, clause:" + clause.pp(self.assignments)
-
-            both_false = True
-            # Check that watched by and watching is consistent
-            for watch_idx in clause.watchlist:
-                var_ = clause.vars[watch_idx]
-                assert var_.watchedBy.count(clause) >= 1, "watchedBy inconsistent with watchlist"
-
-                # Check that what we are watching is not both false
-                both_false &= self.assignments.get_assignment_val(var_) == Assn.FALSE
-
-            assert not both_false, "Cannot be watching both literals false: " + clause.pp(self.assignments)
-
-        def check_watched_by(var_):
-            for clause in var_.watchingClauses():
-                var1 = clause.vars[clause.watchlist[0]] 
-                var2 = clause.vars[clause.watchlist[1]] 
-                assert var1 == var_ or var2 == var_, "Watchlist/watched by invariants broken"
+        Checking that we don't have any clause that is already unsatisfiable,
+        and that the watch lists are consistent.
+        Only checks what the checker's mode asks for, see invariants.py
+        '''
+        if self.checker is not None:
+            self.checker.check()
+
+    def stats(self):
+        '''
+        Search statistics of the last solve
+        '''
+        return {
+            "decisions": self.decisions,
+            "conflicts": self.conflicts,
+            "propagations": self.assignments.propagations,
+            "learnts": self.sat.num_learnts,
+        }
+
+    def model(self):
+        '''
+        DIMACS-style model after a satisfiable solve. If the formula was
+        preprocessed, the model is extended to the variables it removed.
+        '''
+        value = self.assignments.value
+        model = [label if value[2 * var_idx] == TRUE else -label
+                 for var_idx, label in enumerate(self.sat.labels)]
+        if self.sat.preprocessor is not None:
+            model = self.sat.preprocessor.extend_model(model)
+        return model
+
+    def dpll(self):
+        '''
+        Solves the formula and prints the answer
+        '''
+        if self.solve():
+            print("SATISFIABLE")
+            logging.info(self.assignments)
+            logging.info(f"Model: {self.model()}")
+        else:
+            print("UNSATISFIABLE")
+
+    def solve(self):
+        '''
+        Runs the search of the solver's mode, returns True if the formula is
+        satisfiable
+        '''
+        if self.mode == 'cdcl':
+            return self.solve_cdcl()
+        return self.solve_dpll()
+
+    def choose_decision(self):
+        '''
+        Returns the variable and value of the next decision
+        '''
+        var_ = self.assignments.get_unassigned_var()
+        assn = Assn.TRUE
+        try:
+            assn = choose_assn(var_, self.assignments.values, self.sat)
+        except NotImplementedError:
             pass
+        return var_, assn
 
-        # Check that watched by and watching is consistent
-        for variable in VARIABLES.values():
-            posVar = variable.getPos()
-            negVar = variable.getNeg()
-            check_watched_by(posVar)
-            check_watched_by(negVar)
+    def solve_cdcl(self):
+        '''
+        Runs CDCL, returns True if the formula is satisfiable
+        '''
+        assignments = self.assignments
+        while True:
+            if assignments.unit_propagation() < 0:
+                self.conflicts += 1
+                if assignments.decision_level() == 0:
+                    return False
+
+                learnt, level = assignments.analyze()
+                logging.info(f"Learned {len(learnt)} literals, backjumping to level {level}")
+                assignments.backjump(level)
+                assignments.learn(learnt)
+                assignments.order.decay()
+                continue
 
+            self.check_invariants()
+            if assignments.num_unassigned() == 0:
+                return True
 
-    def dpll(self):
+            var_, assn = self.choose_decision()
+            logging.info("Trying " + repr(var_) + ": " + Assn.toStr(assn))
+            self.decisions += 1
+            assignments.create_decision_level(var_, assn)
+
+    def solve_dpll(self):
+        '''
+        Runs DPLL, returns True if the formula is satisfiable
+        '''
         while self.assignments.num_unassigned() > 0:
             if self.assignments.unit_propagation() < 0:
-                print("UNSATISFIABLE")
-                return
+                return False
 
             self.check_invariants()
 
@@ -68,47 +144,55 @@ class SATSolver():
             # Try setting true first
             assn = Assn.TRUE
             try:
-                assn = choose_assn(var_, self.assignments.assignment_stack[-1][0], self.sat)
+                assn = choose_assn(var_, self.assignments.values, self.sat)
             except NotImplementedError:
                 pass
 
             logging.info("Trying " + repr(var_) + ": " + Assn.toStr(assn))
+            self.decisions += 1
             self.assignments.create_decision_level(var_, Assn.TRUE)
             logging.debug(
-                f"Assignment stack size: {len(self.assignments.assignment_stack)}")
+                f"Decision level: {self.assignments.decision_level()}")
 
             # Backtrack until we can unit propagate without conflicts
             while self.assignments.unit_propagation() < 0:
                 # If there are conflicts, backtrack and set the previous
                 # variable to false
                 logging.info("Backtracking...")
-                if len(self.assignments.assignment_stack) <= 1:
+                self.conflicts += 1
+                self.assignments.bump_conflict()
+                if self.assignments.decision_level() == 0:
                     # Out of options
-                    print("UNSATISFIABLE")
-                    return
+                    return False
 
-                conflict_var = self.assignments.assignment_stack[-1][1]
+                conflict_var = self.assignments.decision_variable()
                 old_conflict_assn = self.assignments.get_assignment_val(conflict_var.getPos())
                 assert old_conflict_assn != Assn.UNKNOWN
                 new_conflict_assn = Assn.neg(old_conflict_assn)
                 self.assignments.backtrack()
 
                 logging.debug(
-                    f"Assignment stack size: {len(self.assignments.assignment_stack)}")
+                    f"Decision level: {self.assignments.decision_level()}")
 
                 self.check_invariants()
 
                 logging.info("Trying " + repr(conflict_var) + ": " + Assn.toStr(new_conflict_assn))
                 self.assignments.assign(conflict_var, new_conflict_assn)
 
-        print("SATISFIABLE")
-        logging.info(self.assignments)
+        return True
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-v", "--verbosity", help="increase output verbosity", action="count")
-    parser.add_argument('files', metavar='f', type=str, nargs=1,
-                    help='CNF file to test for satisfiability')
+    parser.add_argument("-c", "--check", help="invariant checking mode, for debugging",
+                        choices=[mode.value for mode in CheckMode], default=CheckMode.OFF.value)
+    parser.add_argument("-o", "--order", help="variable order used to choose splitting variables "
+                        "(default: static for dpll, vsids for cdcl)", choices=list(VARIABLE_ORDERS))
+    parser.add_argument("-m", "--mode", help="search mode", choices=MODES, default='dpll')
+    parser.add_argument("-p", "--preprocess", help="simplify the formula before solving",
+                        action="store_true")
+    parser.add_argument('files', metavar='f', type=str, nargs='+',
+                    help='CNF files to test for satisfiability')
     args = parser.parse_args()
     if args.verbosity == 2:
         logging.basicConfig(level=logging.DEBUG)
@@ -117,8 +201,26 @@ if __name__ == '__main__':
     else:
         logging.basicConfig(level=logging.WARN)
 
-    print(args.files[0])
-    sat = Loader.load_file(args.files[0])
-    logging.info(sat)
-    sat_solver = SATSolver(sat)
-    sat_solver.dpll()
\ No newline at end of file
+    order = args.order
+    if order is None:
+        order = 'static' if args.mode == 'dpll' else 'vsids'
+
+    # An archive stands for all the instances in it
+    instances = []
+    for location in args.files:
+        if location.endswith(ARCHIVE_SUFFIX):
+            instances.extend(archive_members(location))
+        else:
+            instances.append(location)
+
+    # Every file gets its own SAT instance, so they can all be solved in one process
+    for location in instances:
+        print(location)
+        try:
+            sat = Loader.load_file(location, args.preprocess)
+        except UnsatException:
+            print("UNSATISFIABLE")
+            continue
+        logging.info(sat)
+        sat_solver = SATSolver(sat, CheckMode(args.check), order, args.mode)
+        sat_solver.dpll()
\ No newline at end of file